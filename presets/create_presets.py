@@ -4,33 +4,61 @@ import argparse
 
 
 
-def create_prefix_json(filename: str):
-	presets = {'presets': {}}
+def create_channel(schema: int) -> dict:
+	'''The default preset of one channel
+	Args:
+	- schema (int) 1 for the old layout ({"value": ...}), 2 for the layout with a midi channel per control ({"channel": ..., "value": ...})
+	'''
+	def control(value):
+		return {"channel": 0, "value": value} if schema >= 2 else {"value": value}
+
+	return {
+		"name": "",
+		"color": "white",
+		"encoder": control(0),
+		"encoder_led": control(0),
+		"led_bar": control(0),
+		"button_1": control(False),
+		"button_2": control(False),
+		"button_3": control(False),
+		"button_4": control(False),
+		"fader": control(0)}
+
+
+def create_prefix_json(filename: str, banks: int = 100, channels: int = 8, schema: int = 1, indent: int = 4):
+	'''Write a presets file with the default presets, the same output as json.dump(presets, file, indent=indent).
+	The file is streamed bank by bank so the memory use stays the same for any number of banks.
+	Args:
+	- filename (str) The file to write
+	- banks    (int) Number of banks
+	- channels (int) Number of channels per bank
+	- schema   (int) Layout of the presets, see create_channel()
+	- indent   (int) Json indentation
+	'''
+	# render one channel once and only fill in the name for every preset
+	pad = ' ' * indent
+	channel = json.dumps(create_channel(schema), indent=indent).replace('\n', '\n' + pad * 3)
+	before, after = channel.split('"name": ""', 1)
+	before += '"name": '
 
 	presetnum = 1
-	for bank in range(100):
-		presets['presets'][f"bank_{bank}"] = {}
-		for channel in range(8):
-			presets['presets'][f"bank_{bank}"][f"channel_{channel}"] = {
-				"name": f"preset{presetnum}",
-				"color": "white",
-				"encoder": {"value": 0},
-				"encoder_led": {"value": 0},
-				"led_bar": {"value": 0},
-				"button_1": {"value": False},
-				"button_2": {"value": False},
-				"button_3": {"value": False},
-				"button_4": {"value": False},
-				"fader": {"value": 0}}
-
-			presetnum += 1
-	with open(filename, 'w') as file:
-		json.dump(presets, file, indent=4)
+	with open(filename, 'w', buffering=1 << 20) as file:
+		file.write(f'{{\n{pad}"presets": {{')
+		for bank in range(banks):
+			file.write(f'{"," if bank else ""}\n{pad * 2}"bank_{bank}": {{')
+			file.write(','.join(f'\n{pad * 3}"channel_{channel}": {before}"preset{presetnum + channel}"{after}' for channel in range(channels)))
+			file.write(f'\n{pad * 2}}}' if channels else '}')
+			presetnum += channels
+		file.write(f'\n{pad}}}\n}}' if banks else '}\n}')
 
 
 
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser()
 	parser.add_argument('-o', '--output-file')
+	parser.add_argument('-b', '--banks', type=int, default=100, help='number of banks (default 100)')
+	parser.add_argument('-c', '--channels', type=int, default=8, help='number of channels per bank (default 8)')
+	parser.add_argument('-s', '--schema', type=int, default=1, choices=[1, 2], help='1: {"value": ...}, 2: {"channel": ..., "value": ...} (default 1)')
+	parser.add_argument('-i', '--indent', type=int, default=4, help='json indentation (default 4)')
 	args = parser.parse_args()
-	create_prefix_json(args.output_file)
\ No newline at end of file
+	create_prefix_json(args.output_file, args.banks, args.channels, args.schema, args.indent)
@@ -0,0 +1,69 @@
+import time
+
+
+class Timeline:
+	"""A list of keyframes (function calls at a time offset) that is played without blocking.
+	Call tick() regularly (the Bridge does this every tick), every keyframe that is due is run.
+	The outgoing midi of the keyframes is only queued, the writers send it batched.
+	Args:
+	- target	Object the keyframe helpers (led, fader, segments, strip) are called on, for example the XTouch
+	"""
+	def __init__(self, target = None) -> None:
+		self.target = target
+		self.keyframes = []										# (time, order, function, args), sorted when started
+		self.start = None
+		self._next = 0
+
+	@property
+	def done(self) -> bool:
+		return self.start is not None and self._next >= len(self.keyframes)
+
+	@property
+	def duration(self) -> float:
+		return max((keyframe[0] for keyframe in self.keyframes), default=0.0)
+
+	def at(self, seconds: float, function, *args) -> 'Timeline':
+		"""Call function(*args) seconds after the start of the timeline."""
+		self.keyframes.append((seconds, len(self.keyframes), function, args))
+		return self
+
+	# keyframe helpers for the X-Touch
+	def led(self, seconds: float, *leds, on: bool = True) -> 'Timeline':
+		return self.at(seconds, self.target.ledOn if on else self.target.ledOff, *leds)
+
+	def fader(self, seconds: float, fader: int, value: int) -> 'Timeline':
+		return self.at(seconds, self.target._sendMidi, 'control_change', [fader + 70, value])
+
+	def segments(self, seconds: float, idx: int, chars: str) -> 'Timeline':
+		return self.at(seconds, self.target.setSegmentData, idx, chars)
+
+	def strip(self, seconds: float, display: int, top: str, bottom: str = '', color: str = None) -> 'Timeline':
+		if color is not None: self.at(seconds, self.target.setScibbleStripBacklight, display, color)
+		return self.at(seconds, self.target.setScribbleStripData, display, top, bottom)
+
+	def tick(self, now: float = None) -> int:
+		"""Run the keyframes that are due.
+		Returns:
+		- (int)	The number of keyframes that were run
+		"""
+		now = time.perf_counter() if now is None else now
+		if self.start is None:
+			self.keyframes.sort(key=lambda keyframe: keyframe[:2])
+			self.start = now
+		ran = 0
+		while self._next < len(self.keyframes) and self.keyframes[self._next][0] <= now - self.start:
+			_, _, function, args = self.keyframes[self._next]
+			self._next += 1
+			function(*args)
+			ran += 1
+		return ran
+
+	def play(self, interval: float = 1 / 60, flush = None) -> None:
+		"""Play the timeline blocking, for when there is no Bridge running.
+		Args:
+		- interval (float)		Seconds between ticks
+		- flush    (callable)	Called after every tick that ran a keyframe, to send the queued data
+		"""
+		while not self.done:
+			if self.tick() and flush is not None: flush()
+			if not self.done: time.sleep(interval)
@@ -0,0 +1,180 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+from main import XTouch, MyDmx3
+from bridge import Bridge
+from dispatch import Dispatcher
+from presets import BankCache, PresetStore
+from stats import LatencyHistogram
+from transport import LoopbackTransport, LoopbackOutput, CountingOutput
+
+PRESETS_FILE = os.path.join(os.path.dirname(__file__), '..', 'presets', 'presets.json')
+
+
+class BenchTransport(LoopbackTransport):
+	"""Loopback inputs, outputs that only count, so the benchmarks don't fill up memory."""
+	def openOutput(self, port):
+		return CountingOutput()
+
+	def openSurface(self, port):
+		"""A loopback output to write the simulated surface input to."""
+		return LoopbackOutput(self, self._cable(port))
+
+
+def setup() -> tuple:
+	transport = BenchTransport()
+	xt, md = XTouch(), MyDmx3()
+	xt.connect('xt-in', 'xt-out', transport)
+	xt.bandwidth = None	# measure the code, not the modelled midi cable
+	md.connect('md-in', 'md-out', transport)
+	return transport, xt, md
+
+
+# every benchmark returns (operation, number of midi events/frames one call handles)
+
+def benchSegments():
+	_, xt, _ = setup()
+	texts = ['0123456789ab', '00channel  ', '99presets  ', '12.34.56.78']
+	counter = iter(range(1 << 62))
+	def op():
+		xt.setSegmentData(0, texts[next(counter) & 3])
+		xt.flushDisplays(force=True)
+	return op, 1
+
+def benchScribbleStrips():
+	_, xt, _ = setup()
+	names = ['preset1', 'kick', 'a very long name', '']
+	counter = iter(range(1 << 62))
+	def op():
+		i = next(counter)
+		xt.setScribbleStripData(i & 7, names[i & 3], f'{i & 127}')
+		xt.flushDisplays(force=True)
+	return op, 1
+
+def benchLedAllOn():
+	_, xt, _ = setup()
+	return xt.ledAllOn, 94
+
+def benchGetData():
+	transport, xt, _ = setup()
+	surface = transport.openSurface('xt-in')
+	# a button press/release and 8 fader moves per read, like a busy surface
+	burst = [[[0x90, 92, 127], 0], [[0x90, 92, 0], 0], *[[[0xb0, 70 + i, i * 8], 0] for i in range(8)]]
+	def op():
+		surface.write(burst)
+		xt.getData()
+	return op, len(burst)
+
+def benchBankSwitch():
+	_, xt, _ = setup()
+	xt.presets = BankCache(PresetStore(PRESETS_FILE))
+	xt.updateMode('presets')
+	def op():
+		xt.updateBank(1)
+		xt.flushDisplays(force=True)
+		xt.flushMidi()
+	return op, 9	# 1 segment frame and 8 scribble strips
+
+def benchFaderSweep():
+	transport, xt, md = setup()
+	surface = transport.openSurface('xt-in')
+	dispatcher = Dispatcher(Bridge(xt, md), xt, buttons={})	# no keyboard in the benchmarks, the bridge isn't run
+	sweep = [[[[0xb0, 70 + fader, value], 0] for fader in range(8)] for value in range(128)]
+	counter = iter(range(1 << 62))
+	def op():
+		surface.write(sweep[next(counter) & 127])
+		dispatcher.dispatch(xt.getData())
+		md.flushUniverse()
+		md.flushMidi()
+	return op, 8
+
+BENCHMARKS = {
+	'setSegmentData': benchSegments,
+	'setScribbleStripData': benchScribbleStrips,
+	'ledAllOn': benchLedAllOn,
+	'getData+coalesce': benchGetData,
+	'bankSwitch': benchBankSwitch,
+	'faderSweep→MyDmx3': benchFaderSweep}
+
+
+def run(name: str, duration: float) -> dict:
+	"""Run one benchmark for about duration seconds.
+	Returns:
+	- (dict)	events per second, peak traced bytes per event and latency percentiles (us) per call
+	"""
+	op, events = BENCHMARKS[name]()
+	for _ in range(100): op()	# warm up (caches, prefetch)
+
+	histogram = LatencyHistogram()
+	clock = time.perf_counter_ns
+	calls, start = 0, clock()
+	end = start + int(duration * 1e9)
+	while True:
+		before = clock()
+		op()
+		after = clock()
+		histogram.record(after - before)
+		calls += 1
+		if after >= end: break
+	elapsed = (clock() - start) / 1e9
+
+	# cpython has no allocation counter, the traced peak memory of a fixed number of calls is used instead
+	allocCalls = 1000
+	tracemalloc.start()
+	tracemalloc.reset_peak()
+	for _ in range(allocCalls): op()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	summary = histogram.summary()
+	return {
+		'events_per_sec': calls * events / elapsed,
+		'bytes_per_event': peak / (allocCalls * events),
+		'p50_us': summary['p50'],
+		'p99_us': summary['p99'],
+		'max_us': summary['max']}
+
+def compare(results: dict, baseline: dict) -> None:
+	print(f'\n{"benchmark":24} {baseline["version"]:>14} {results["version"]:>14} {"change":>8}')
+	for name, result in results['results'].items():
+		old = baseline['results'].get(name)
+		if old is None: continue
+		change = result['events_per_sec'] / old['events_per_sec'] - 1
+		print(f'{name:24} {old["events_per_sec"]:14,.0f} {result["events_per_sec"]:14,.0f} {change:+8.1%}')
+
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='benchmark the bridge hot paths against a in memory transport')
+	parser.add_argument('-b', '--benchmark', action='append', choices=list(BENCHMARKS), help='benchmark to run (default all), can be given more than once')
+	parser.add_argument('-d', '--duration', type=float, default=1.0, help='seconds per benchmark (default 1)')
+	parser.add_argument('-v', '--version', default='v1.1-dev', help='version label stored in the results')
+	parser.add_argument('-o', '--output', help='json file to store the results in (default benchmark-<version>.json)')
+	parser.add_argument('-c', '--compare', help='results json of a earlier run to compare with')
+	args = parser.parse_args()
+
+	results = {
+		'version': args.version,
+		'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'results': {}}
+
+	print(f'{"benchmark":24} {"events/s":>14} {"bytes/event":>12} {"p50 us":>8} {"p99 us":>8} {"max us":>9}')
+	for name in args.benchmark or BENCHMARKS:
+		with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):	# the bank/mode methods print
+			result = run(name, args.duration)
+		results['results'][name] = result
+		print(f'{name:24} {result["events_per_sec"]:14,.0f} {result["bytes_per_event"]:12.1f} {result["p50_us"]:8.1f} {result["p99_us"]:8.1f} {result["max_us"]:9.1f}')
+
+	with open(args.output or f'benchmark-{args.version}.json', 'w') as file:
+		json.dump(results, file, indent=4)
+
+	if args.compare:
+		with open(args.compare, 'r') as file:
+			compare(results, json.load(file))
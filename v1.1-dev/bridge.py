@@ -0,0 +1,256 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from clock import MidiClock
+from dispatch import Dispatcher
+from helper import CONTROLS
+from stats import Latency
+from tempo import TapTempo
+from universe import CHANNELS, DmxUniverse, toLevel
+
+
+class PortReader(threading.Thread):
+	"""Reads a MIDI input port on its own thread.
+	PortMidi can't wake a thread when data comes in, so the port is polled. While the port is in use it is polled
+	every interval seconds, after idleAfter seconds without data the sleep doubles on every empty poll up to maxInterval.
+	The first data resets it. The first message after a idle period can be up to maxInterval late, so the default
+	keeps that under 1 ms (most presses come after a quiet period), a bigger maxInterval saves cpu at the cost of that latency.
+	Args:
+	- device      (MidiDevice)	The device to read from
+	- callback    (callable)	Called with (device, messages) for every read
+	- interval    (float)		Seconds to sleep between polls while the port is in use, the added latency
+	- maxInterval (float)		Max seconds to sleep when the port is idle, the max latency of the first message after a idle period
+	- idleAfter   (float)		Seconds without data after which the port is idle
+	"""
+	def __init__(self, device, callback, interval: float = 0.0005, maxInterval: float = 0.001, idleAfter: float = 2.0) -> None:
+		super().__init__(name=f'reader-{device.device}', daemon=True)
+		self.device = device
+		self.callback = callback
+		self.interval = interval
+		self.maxInterval = maxInterval
+		self.idleAfter = idleAfter
+		self._stopEvent = threading.Event()
+
+	def run(self) -> None:
+		wait, interval = self._stopEvent.wait, self.interval
+		lastData = time.perf_counter()
+		while not self._stopEvent.is_set():
+			if self.device.poll():
+				data = self.device.getData()
+				if data: self.callback(self.device, data)
+				lastData, interval = time.perf_counter(), self.interval
+			else:
+				if interval < self.maxInterval and time.perf_counter() - lastData > self.idleAfter:
+					interval = min(interval * 2, self.maxInterval)
+				wait(interval)
+
+	def stop(self) -> None:
+		self._stopEvent.set()
+
+
+class Bridge:
+	"""The asyncio runtime between the X-Touch (and its extenders) and MyDMX.
+	Every direction runs independently so a fader storm from the X-Touch never delays MyDMX feedback:
+	- a PortReader thread per input port, feeding a asyncio queue
+	- a dispatch task per input port
+	- a writer task per device, the blocking port writes are done on a writer thread per device
+	  (every extender is a device of its own, so it never delays the X-Touch)
+	- timer tasks (display refresh, bpm, animations), add them with addTimer()
+	- the midi clock to MyDMX on its own timing thread, see MidiClock
+	Args:
+	- xtouch (XTouch)	The connected X-Touch
+	- mydmx  (MyDmx3)	The connected MyDMX port
+	- tick   (float)	Seconds between display refreshes
+	"""
+	def __init__(self, xtouch, mydmx, tick: float = 1 / 60) -> None:
+		self.xtouch = xtouch
+		self.mydmx = mydmx
+		self.devices = [*xtouch.surfaces, mydmx]
+		self.running = False
+		self.loop = None
+		self.timers = []
+		self.animations = []									# playing Timelines
+		self.tempo = TapTempo()
+		self.clock = MidiClock(mydmx, self.tempo)				# starts with the first tapped tempo
+		self.universe = xtouch.universe = mydmx.universe = DmxUniverse()	# the channel levels, the faders set them
+		self._shownBpm = None
+		self._shownDigits = None								# segments 9-11 after the last showTempo, to see if they were cleared
+		self.addTimer(tick, self._animate)
+		self.addTimer(tick, self._showTempo)
+		for surface in xtouch.surfaces: self.addTimer(tick, surface.flushDisplays)
+		self.addTimer(tick, mydmx.flushUniverse)				# backstop for levels changed outside a dispatch (animations, a failed handler)
+		self.dispatcher = Dispatcher(self, xtouch)
+		# the extenders have no buttons, footswitch or jog wheel, only their faders (on their own strips) and encoders
+		encoders = {number: control for number, control in CONTROLS.items() if control[0] == 'turnEncoder'}
+		self.extenders = {extender: Dispatcher(self, extender, buttons={}, controls={
+			**encoders, **{70 + i: ('moveFader', extender.offset + i) for i in range(8)}}) for extender in xtouch.extenders}
+		self.latency = Latency()								# in→out latency per route, see Latency.summary()
+		for device in self.devices: device.latency = self.latency
+
+	def addTimer(self, interval: float, callback) -> None:
+		"""Call callback every interval seconds while the bridge is running.
+		Needs to be called before run().
+		"""
+		self.timers.append((interval, callback))
+
+	def play(self, timeline) -> None:
+		"""Play a Timeline on the tick timer, next to the normal input handling."""
+		self.animations.append(timeline)
+
+	def _animate(self) -> None:
+		for timeline in self.animations: timeline.tick()
+		self.animations = [timeline for timeline in self.animations if not timeline.done]
+
+	def run(self) -> None:
+		"""Run the bridge until stop() is called or ctrl+c is pressed."""
+		try:
+			asyncio.run(self._main())
+		except KeyboardInterrupt:
+			pass
+
+	def stop(self) -> None:
+		"""Stop the bridge, can be called from any thread."""
+		if self.loop is not None and self.running:
+			self.loop.call_soon_threadsafe(self._stopped.set)
+
+	async def _main(self) -> None:
+		self.loop = asyncio.get_running_loop()
+		self._stopped = asyncio.Event()
+		self._pending = {device: asyncio.Event() for device in self.devices}
+		self._keys = ThreadPoolExecutor(1, thread_name_prefix='keyboard')	# one thread so presses and releases stay in order
+		for device in self.devices:
+			device.writer = ThreadPoolExecutor(1, thread_name_prefix=f'writer-{device.device}')
+
+		handlers = {
+			self.xtouch: self.handleXTouch,
+			self.mydmx: self.handleMyDmx,
+			**{extender: dispatcher.dispatch for extender, dispatcher in self.extenders.items()}}
+		inbound = {device: asyncio.Queue() for device in handlers}
+		readers = [PortReader(device, self._onData(queue)) for device, queue in inbound.items()]
+		tasks = [
+			*[asyncio.create_task(self._dispatch(device, inbound[device], handler)) for device, handler in handlers.items()],
+			*[asyncio.create_task(self._writer(device))			for device in self.devices],
+			*[asyncio.create_task(self._timer(interval, callbacks))	for interval, callbacks in self._timerGroups().items()]]
+
+		self.running = True
+		for reader in readers: reader.start()
+		try:
+			await self._stopped.wait()
+		finally:
+			self.running = False
+			self.clock.stop()
+			for reader in readers: reader.stop()
+			for task in tasks: task.cancel()
+			await asyncio.gather(*tasks, return_exceptions=True)
+			for device in self.devices:
+				device.flushMidi(limit=False)
+				device.writer.shutdown(wait=True)	# let the writes that are already queued finish
+				device.writer = None
+			self._keys.shutdown(wait=True)
+			for reader in readers: reader.join(timeout=1)
+			print(self.latency.report())
+			if self.clock.pulses:
+				jitter = self.clock.summary()
+				print(f'clock jitter us: p50 {jitter["p50"]:.1f}, p99 {jitter["p99"]:.1f}, max {jitter["max"]:.1f}, {jitter["resyncs"]} resyncs')
+
+	def _onData(self, queue: asyncio.Queue):
+		# called on the reader thread, hand the data to the event loop
+		return lambda device, data: self.loop.call_soon_threadsafe(queue.put_nowait, data)
+
+	async def _dispatch(self, device, queue: asyncio.Queue, handler) -> None:
+		while True:
+			data = await queue.get()
+			self.latency.current = (device.device, data[0][4])	# every message of a read has the same arrival time
+			try:
+				handler(data)
+				self.mydmx.flushUniverse()						# the changed levels right away, with the origin of this read
+			except Exception as e:	# a broken mapping must not stop the input of the device
+				device.error(f'Exception <{e!r}> raised while handling {data}')
+			finally:
+				self.latency.current = None
+			self._wake()
+
+	async def _writer(self, device) -> None:
+		pending = self._pending[device]
+		while True:
+			await pending.wait()
+			pending.clear()
+			device.flushMidi()
+
+	def _timerGroups(self) -> dict:
+		# timers with the same interval share one task, so a idle bridge wakes up once per tick
+		groups = {}
+		for interval, callback in self.timers: groups.setdefault(interval, []).append(callback)
+		return groups
+
+	async def _timer(self, interval: float, callbacks: list) -> None:
+		deadline = self.loop.time()
+		while True:
+			deadline += interval
+			await asyncio.sleep(max(0, deadline - self.loop.time()))
+			for callback in callbacks:
+				try:
+					callback()
+				except Exception as e:	# report it on the device of the callback, keep the timer running
+					device = getattr(callback, '__self__', None)
+					if not hasattr(device, 'error'): device = self.xtouch
+					device.error(f'Exception <{e!r}> raised in timer {getattr(callback, "__qualname__", callback)}')
+			self._wake()
+
+	def _wake(self) -> None:
+		# let the writer tasks flush the midi that was queued
+		for pending in self._pending.values(): pending.set()
+
+	def handleXTouch(self, data: list) -> None:
+		self.dispatcher.dispatch(data)
+
+	def handleMyDmx(self, data: list) -> None:
+		# send the feedback from MyDMX straight back to the X-Touch
+		for type, number, value, *_ in data:
+			self.xtouch._sendMidi(type, [number, value])
+
+	def tapTempo(self) -> None:
+		self.tempo.tap(self.dispatcher.timestamp / 1000)
+		if self.tempo.bpm and self.running: self.clock.start()
+
+	def footswitch(self, value: int) -> None:
+		# the footswitch sends 0 or 48 when pressed and 127 or 175 when released
+		if value in (0, 48):
+			self.xtouch.ledOn(93)
+			self.tapTempo()
+		else:
+			self.xtouch.ledOff(93)
+
+	def moveFader(self, strip: int, value: int) -> None:
+		# in channel mode the faders set the levels of the shown channels
+		if self.xtouch.mode != 'channel': return
+		channel = self.xtouch.channelBank * 8 + strip
+		if channel >= CHANNELS: return
+		level = toLevel(value)
+		self.universe.set(channel, level)	# MyDMX gets it with the flushUniverse() after the handler
+		surface, display = self.xtouch.surfaceOf(strip)
+		surface.showChannel(display, channel, level, fader=False)
+
+	def _showTempo(self) -> None:
+		# the taps only update the tempo, the display follows on the tick timer
+		# nothing to show before the first tempo, and a playing animation owns the digits (redrawn when it clears them)
+		if not self.tempo.bpm or self.animations: return
+		bpm = round(self.tempo.bpm)
+		if bpm != self._shownBpm or self.xtouch.segments[9:] != self._shownDigits:	# new bpm or the display was cleared
+			self._shownBpm = bpm
+			self.xtouch.showTempo(bpm)
+			self._shownDigits = self.xtouch.segments[9:]
+
+	def pressKey(self, key: str) -> None:
+		self.loop.run_in_executor(self._keys, _keyboard, 'press', key)
+
+	def releaseKey(self, key: str) -> None:
+		self.loop.run_in_executor(self._keys, _keyboard, 'release', key)
+
+
+def _keyboard(action: str, key: str) -> None:
+	# keyboard is imported on the keyboard thread the first time a key is used, not at startup
+	import keyboard
+	getattr(keyboard, action)(key)
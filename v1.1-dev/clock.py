@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+
+from stats import LatencyHistogram
+
+CLOCK, START, STOP = 0xf8, 0xfa, 0xfc
+
+
+class MidiClock:
+	"""MIDI clock (24 pulses per quarter note) with start/stop, on its own timing thread.
+	Every pulse has a absolute deadline, the next deadline is the last one plus one period at the current tempo,
+	so a late wake up or a slow write never moves the pulses after it. The thread sleeps until just before
+	the deadline and spins the last part, the spin gives up the GIL on every turn so the bridge threads keep running.
+	While the clock runs the interpreter switches threads more often (switchInterval), so the woken clock thread
+	gets the GIL back quickly. If it falls more than a beat behind (for example after a suspend)
+	it starts again from now instead of sending all the missed pulses at once.
+	The pulses are written straight to the output port, not through the queue, so they are never delayed by a flush.
+	Args:
+	- device         (MidiDevice)	The device to send the clock to
+	- tempo						Anything with a bpm attribute, for example a TapTempo
+	- ppqn           (int)			Pulses per quarter note
+	- spin           (float)		Seconds before a deadline to stop sleeping and start spinning
+	- switchInterval (float)		sys.setswitchinterval() while the clock runs, None to leave it
+	"""
+	def __init__(self, device, tempo, ppqn: int = 24, spin: float = 0.0002, switchInterval: float = 0.0005) -> None:
+		self.device = device
+		self.tempo = tempo
+		self.ppqn = ppqn
+		self.spin = spin
+		self.switchInterval = switchInterval
+		self.jitter = LatencyHistogram()						# ns between the deadline and the end of the write of every pulse
+		self.pulses = 0
+		self.resyncs = 0
+		self._thread = None
+		self._stopEvent = threading.Event()
+		self._switchInterval = None								# the switch interval before start, restored on stop
+
+	@property
+	def running(self) -> bool:
+		return self._thread is not None and self._thread.is_alive()
+
+	def start(self) -> None:
+		"""Send start and begin sending the clock."""
+		if self.running: return
+		self._stopEvent.clear()
+		self._thread = threading.Thread(target=self._run, name=f'clock-{self.device.device}', daemon=True)
+		if self.switchInterval is not None:
+			self._switchInterval = sys.getswitchinterval()
+			sys.setswitchinterval(min(self.switchInterval, self._switchInterval))
+		self.device.sendRealtime(START)
+		self._thread.start()
+
+	def stop(self) -> None:
+		"""Stop sending the clock and send stop."""
+		if not self.running: return
+		self._stopEvent.set()
+		self._thread.join()
+		self._thread = None
+		if self._switchInterval is not None:
+			sys.setswitchinterval(self._switchInterval)
+			self._switchInterval = None
+		self.device.sendRealtime(STOP)
+
+	def summary(self) -> dict:
+		"""LatencyHistogram.summary() of the jitter (in us), with the number of resyncs."""
+		return {**self.jitter.summary(), 'resyncs': self.resyncs}
+
+	def _run(self) -> None:
+		clock, wait, stopped, yieldGil = time.perf_counter_ns, self._stopEvent.wait, self._stopEvent.is_set, time.sleep
+		spin = int(self.spin * 1e9)
+		deadline = clock()
+		while not stopped():
+			bpm = self.tempo.bpm
+			if not bpm:											# no tempo (anymore), wait for one
+				wait(0.01)
+				deadline = clock()
+				continue
+
+			period = 60e9 / (bpm * self.ppqn)
+			deadline += period
+			now = clock()
+			if now - deadline > period * self.ppqn:				# more than a beat behind
+				self.resyncs += 1
+				deadline = now
+			elif deadline - now > spin and wait((deadline - now - spin) / 1e9):
+				break
+			while clock() < deadline: yieldGil(0)
+
+			self.device.sendRealtime(CLOCK)
+			self.jitter.record(clock() - deadline)				# after the write, so a write that waited for the port counts
+			self.pulses += 1
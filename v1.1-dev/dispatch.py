@@ -0,0 +1,81 @@
+# import helper data/constants/functions
+from helper import BUTTONS, CONTROLS, FEEDBACK, RELEASES, TIMESTAMPED
+		# - button to function mapping
+		# - control change to function mapping
+		# - buttons with led feedback
+		# - functions that also need a release call
+		# - functions that also get the midi timestamp
+
+
+class Dispatcher:
+	"""Compiles the BUTTONS and CONTROLS mappings into flat lookup tables.
+	There is a 128 entry table for every message type, with a callable (or None) for every note/controller.
+	Handling a message is one index lookup and one call.
+	The function names are looked up on the targets in order, the first target that has it is used.
+	Args:
+	- targets	The objects to look up the functions on (for example the Bridge and the XTouch)
+	"""
+	def __init__(self, *targets, buttons: dict = BUTTONS, controls: dict = CONTROLS) -> None:
+		self.targets = targets
+		self.buttons = buttons
+		self.controls = controls
+		self.timestamp = 0										# midi timestamp (ms) of the message that is being handled
+		self.compile()
+
+	def compile(self) -> None:
+		"""(Re)build the lookup tables, call this after changing the mappings."""
+		noteOn, noteOff, controlChange = [None] * 128, [None] * 128, [None] * 128
+
+		for note, (method, *args) in self.buttons.items():
+			button = self._button(note, method, args)
+			noteOn [note] = button
+			noteOff[note] = button
+
+		for cc, (method, *args) in self.controls.items():
+			controlChange[cc] = self._control(method, args)
+
+		self.tables = {
+			'note_on': noteOn,
+			'note_off': noteOff,
+			'control_change': controlChange}
+
+	def dispatch(self, data: list) -> None:
+		"""Call the mapped function for every message.
+		Args:
+		- data (list)	Messages as returned by MidiDevice.getData(), [type, number, value, timestamp, ...]
+		"""
+		tables = self.tables
+		for type, number, value, timestamp, *_ in data:
+			table = tables.get(type)
+			if table is None: continue
+			function = table[number]
+			if function is not None:
+				self.timestamp = timestamp
+				function(type, value)
+
+	def _resolve(self, method: str):
+		for target in self.targets:
+			function = getattr(target, method, None)
+			if function is not None: return function
+		raise AttributeError(f'Function <{method}> not found on any of the dispatch targets.')
+
+	def _button(self, note: int, method: str, args: list):
+		press = self._resolve(method)
+		release = self._resolve(RELEASES[method]) if method in RELEASES else None
+		led = note - 8 if note in FEEDBACK else None
+		ledOn, ledOff = (self._resolve('ledOn'), self._resolve('ledOff')) if led is not None else (None, None)
+
+		# note_on with value 0 and note_off are both a release
+		def button(type, value):
+			if type == 'note_on' and value:
+				if led is not None: ledOn(led)
+				press(*args)
+			else:
+				if led is not None: ledOff(led)
+				if release is not None: release(*args)
+		return button
+
+	def _control(self, method: str, args: list):
+		function = self._resolve(method)
+		if method in TIMESTAMPED: return lambda type, value: function(*args, value, self.timestamp)
+		return lambda type, value: function(*args, value)
@@ -0,0 +1,119 @@
+from array import array
+
+# import helper data/constants/functions
+from helper import ENCODERCURVES, BANKS, RELATIVE
+
+# encoder value to 0-127, for the bulk clamping
+CLAMP = bytes(min(value, 127) for value in range(256))
+
+
+class Acceleration:
+	"""Encoder acceleration, the faster a encoder is turned the bigger the steps.
+	The step of a detent comes from the time since the previous detent of the same encoder (the midi timestamps)
+	and the curve, the curve is compiled into a lookup table with the step for every ms.
+	Turning the other way starts again at step 1. All state is kept in preallocated arrays, one entry per encoder.
+	Args:
+	- encoders (int)	Number of encoders
+	- curve    (str)	Name of the curve in ENCODERCURVES
+	"""
+	def __init__(self, encoders: int = 8, curve: str = 'medium') -> None:
+		self.encoders = encoders
+		self._last = array('q', [-1 << 40] * encoders)			# timestamp (ms) of the last detent
+		self._direction = array('b', bytes(encoders))			# direction of the last detent, 1 or -1
+		self.setCurve(curve)
+
+	def setCurve(self, curve: str) -> None:
+		"""Use a other curve from ENCODERCURVES."""
+		points = ENCODERCURVES[curve]
+		table = array('B', [1] * (max((ms for ms, _ in points), default=0) + 1))
+		for ms, step in sorted(points, reverse=True):	# the faster rows overwrite the slower ones
+			for interval in range(ms + 1): table[interval] = step
+		self.curve = curve
+		self._table = table
+
+	def step(self, encoder: int, direction: int, timestamp: int) -> int:
+		"""The signed step of a detent.
+		Args:
+		- encoder   (int)	The encoder
+		- direction (int)	1 or -1
+		- timestamp (int)	Midi timestamp of the detent in ms
+		"""
+		interval = timestamp - self._last[encoder]
+		self._last[encoder] = timestamp
+		if direction != self._direction[encoder]:
+			self._direction[encoder] = direction
+			return direction
+		table = self._table
+		return direction * (table[interval] if 0 <= interval < len(table) else 1)
+
+	def reset(self, encoder: int = None) -> None:
+		"""Forget the speed of a encoder or all encoders."""
+		for i in range(self.encoders) if encoder is None else (encoder,):
+			self._last[i] = -1 << 40
+			self._direction[i] = 0
+
+
+class EncoderBank:
+	"""The encoders of a surface for every bank, in flat arrays with one entry per encoder per bank:
+	the value (0-127), the mode (RELATIVE or ABSOLUTE, how the X-Touch sends it) and the led ring position last send.
+	Switching banks only moves offset, the encoder methods work on the current bank.
+	Args:
+	- banks    (int)	Number of banks
+	- encoders (int)	Encoders per bank
+	"""
+	def __init__(self, banks: int = BANKS['channel'], encoders: int = 8) -> None:
+		self.banks = banks
+		self.encoders = encoders
+		self.values = array('B', bytes(banks * encoders))
+		self.modes  = array('B', [RELATIVE] * (banks * encoders))
+		self.rings  = array('b', [-1] * (banks * encoders))		# -1 is unknown, send the next time
+		self.offset = 0											# index of the first encoder of the current bank
+		self.bank = 0
+
+	def __len__(self) -> int:
+		return len(self.values)
+
+	def setBank(self, bank: int) -> None:
+		"""Make bank the current bank. The rings still show the old bank, so its ring positions are forgotten."""
+		self.bank = bank
+		self.offset = bank * self.encoders
+		self.rings[self.offset:self.offset + self.encoders] = array('b', [-1] * self.encoders)
+
+	def get(self, encoder: int) -> int:
+		return self.values[self.offset + encoder]
+
+	def set(self, encoder: int, value: int) -> int:
+		self.values[self.offset + encoder] = value = max(0, min(value, 127))
+		return value
+
+	def add(self, encoder: int, step: int) -> int:
+		return self.set(encoder, self.values[self.offset + encoder] + step)
+
+	def mode(self, encoder: int) -> int:
+		return self.modes[self.offset + encoder]
+
+	def setMode(self, encoder: int, mode: int) -> None:
+		self.modes[self.offset + encoder] = mode
+
+	def view(self, bank: int = None) -> memoryview:
+		"""The values of a bank (the current bank if not given), a view so it can be read and written without copying."""
+		start = (self.bank if bank is None else bank) * self.encoders
+		return memoryview(self.values)[start:start + self.encoders]
+
+	def clamp(self) -> None:
+		"""Cap every value of every bank to 0-127, for after writing to the arrays directly."""
+		memoryview(self.values)[:] = self.values.tobytes().translate(CLAMP)
+
+	def ringMoved(self, encoder: int) -> bool:
+		"""True (once) if the led ring of the encoder needs a other position for its value than the one last send.
+		The ring has 13 leds, so most value changes don't move it.
+		"""
+		index = self.offset + encoder
+		position = self.values[index] * 13 >> 7
+		if position == self.rings[index]: return False
+		self.rings[index] = position
+		return True
+
+	def forgetRings(self) -> None:
+		"""Forget all ring positions, for example after the rings were cleared."""
+		memoryview(self.rings)[:] = array('b', [-1] * len(self.rings))
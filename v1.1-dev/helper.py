@@ -23,9 +23,65 @@ BUTTONS = {
     96: ('pressKey', 'up'),
     97: ('pressKey', 'down'),
     98: ('pressKey', 'left'),
-    99: ('pressKey', 'right')
+    99: ('pressKey', 'right'),
+    101: ('tapTempo',)
 }
 
+# buttons that light their own led while they are pressed (led number = note - 8)
+FEEDBACK = (92, 93, 96, 97, 98, 99, 101)
+
+# functions that need to be called again when the button is released
+# the release function gets the same arguments as the press function
+RELEASES = {
+    'pressKey': 'releaseKey'
+}
+
+# functions that also get the midi timestamp (ms) of the message, after the value
+TIMESTAMPED = ('turnEncoder',)
+
+# map control changes to functions, the same way as BUTTONS
+# the received value is added as the last argument
+# as example, map the jog wheel to "jogWheel(value)"
+# 88: ('jogWheel',)
+CONTROLS = {
+    64: ('footswitch',),
+    **{70 + i: ('moveFader', i) for i in range(8)},     # faders 0-7
+    88: ('jogWheel',),
+    **{80 + i: ('turnEncoder', i) for i in range(8)}    # encoders 0-7
+}
+
+
+# control changes that are never coalesced when they come in fast
+# the encoders and jog wheel are relative (every message is a step) and 64 is the footswitch (a button)
+UNMERGED = (64, *range(80, 89))
+
+
+# encoder acceleration curves, (max ms since the previous detent, step)
+# a detent gets the step of the fastest row it fits in, slower turns step 1
+ENCODERCURVES = {
+    'off':    (),
+    'gentle': ((20, 4), (40, 2)),
+    'medium': ((10, 9), (25, 5), (50, 2)),
+    'fast':   ((10, 16), (25, 8), (50, 4), (100, 2))
+}
+
+
+# number of banks (of 8 channels) per mode
+# 64 channel banks are the 512 channels of a dmx universe
+BANKS = {
+    'channel': 64,
+    'presets': 100
+}
+
+
+# outbound priority classes, a lower class is always send first
+# button/mode leds, then fader motors and led rings, then the lcd and 7-segment displays
+LED, MOTOR, DISPLAY = 0, 1, 2
+
+
+# encoder modes, relative sends 65/1 per detent and absolute sends the value (0-127)
+RELATIVE, ABSOLUTE = 0, 1
+
 
 # used midi message types
 MIDITYPES = {
@@ -33,6 +89,9 @@ MIDITYPES = {
 			'note_off': 0x80,
 			'control_change': 0xb0}
 
+# status byte to midi message type
+MIDINAMES = {status: type for type, status in MIDITYPES.items()}
+
 # backlight colors
 COLORS = {
 		'off'	 : 0b000,
@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+
+from presets import BUTTONS, CONTROLS
+
+FIELDS = ('name', 'color', *CONTROLS, *BUTTONS)						# the fields a edit can change
+
+
+class PresetJournal:
+	"""Append only journal for preset edits on top of a PresetStore.
+	Every edit is one json line ([bank, channel, field, value]) appended to <file>.journal,
+	a background thread fsyncs the journal at most every syncInterval seconds.
+	After compactAfter edits the journal is merged into the presets file on a background thread,
+	the new file is written next to it and swapped in with os.replace so a crash never leaves a broken presets file.
+	Edits that are not compacted yet are replayed when the journal is opened again.
+	Args:
+	- store        (PresetStore)	The presets file
+	- syncInterval (float)			Max seconds between a edit and its fsync
+	- compactAfter (int)			Number of edits after which the journal is compacted
+	"""
+	def __init__(self, store, syncInterval: float = 0.05, compactAfter: int = 1000) -> None:
+		self.store = store
+		self.path = store.path + '.journal'
+		self.syncInterval = syncInterval
+		self.compactAfter = compactAfter
+		self._edits = {}										# (bank, channel): {field: value} not compacted yet
+		self._compacting = {}									# edits that are being merged into the presets file
+		self._count = 0
+		self._dirty = False
+		self._lock = threading.Lock()							# the journal file and the edits
+		self._syncLock = threading.Lock()						# a fsync, so the file isn't swapped during it
+		self._storeLock = threading.Lock()						# the presets file, so it isn't read while it is swapped
+		self._channels = len(store.getBank(0)) if len(store) else 0	# channels per bank, the same for every bank
+		self._compactor = None
+
+		# edits from a compaction that didn't finish are older than the ones in the journal
+		for path in (self.path + '.compacting', self.path):
+			self._count += self._replay(path, self._edits)
+		if os.path.exists(self.path + '.compacting'):
+			# merge them into one journal so the next compaction can't overwrite them
+			with open(self.path + '.tmp', 'w', encoding='utf-8') as file:
+				for (bank, channel), fields in self._edits.items():
+					for field, value in fields.items():
+						file.write(json.dumps([bank, channel, field, value]) + '\n')
+				file.flush()
+				os.fsync(file.fileno())
+			os.replace(self.path + '.tmp', self.path)
+			os.remove(self.path + '.compacting')
+		self._file = open(self.path, 'a', encoding='utf-8')
+
+		self._stopEvent = threading.Event()
+		self._syncer = threading.Thread(target=self._syncLoop, name='journal-sync', daemon=True)
+		self._syncer.start()
+
+	def set(self, bank: int, channel: int, field: str, value) -> None:
+		"""Save one edit.
+		Args:
+		- bank    (int)	The bank number
+		- channel (int)	The channel in the bank
+		- field   (str)	'name', 'color' or a control ('encoder', 'encoder_led', 'led_bar', 'button_1'-'button_4', 'fader')
+		- value			The new value
+		Raises:
+		- ValueError	For a unknown bank, channel or field, they would break every compaction after it
+		"""
+		if field not in FIELDS:	raise ValueError(f'Unknown preset field <{field}>.')
+		if bank not in self.store:	raise ValueError(f'Bank <{bank}> out of range. (0-{len(self.store) - 1})')
+		if not isinstance(channel, int) or not 0 <= channel < self._channels:
+			raise ValueError(f'Channel <{channel}> out of range. (0-{self._channels - 1})')
+
+		line = json.dumps([bank, channel, field, value]) + '\n'
+		with self._lock:
+			self._file.write(line)
+			self._edits.setdefault((bank, channel), {})[field] = value
+			self._dirty = True
+			self._count += 1
+			compact = self._count >= self.compactAfter and self._compactor is None
+		if compact: self.compactInBackground()
+
+	def getBank(self, bank: int) -> dict:
+		"""Read a bank from the presets file with the edits applied, same result as PresetStore.getBank()."""
+		with self._storeLock: data = self.store.getBank(bank)
+		with self._lock:
+			for edits in (self._compacting, self._edits):
+				for (editBank, channel), fields in edits.items():
+					if editBank == bank: self._apply(data[f'channel_{channel}'], fields)
+		return data
+
+	def __len__(self) -> int:
+		return len(self.store)
+
+	def sync(self) -> None:
+		"""Write the journal to disk now.
+		Only the flush holds the edit lock, set() never waits for the fsync.
+		"""
+		with self._syncLock:
+			with self._lock:
+				if not self._dirty: return
+				self._dirty = False
+				self._file.flush()
+			os.fsync(self._file.fileno())
+
+	def compactInBackground(self) -> None:
+		with self._lock:
+			if self._compactor is not None: return
+			self._compactor = threading.Thread(target=self.compact, name='journal-compact', daemon=True)
+		self._compactor.start()
+
+	def compact(self) -> None:
+		"""Merge the journal into the presets file."""
+		# move the current journal aside, new edits go to a new journal while the presets file is written
+		with self._syncLock:
+			with self._lock:
+				self._file.close()
+				os.replace(self.path, self.path + '.compacting')
+				self._file = open(self.path, 'a', encoding='utf-8')
+				self._compacting, self._edits = self._edits, {}
+				self._count = 0
+				self._dirty = False
+			with open(self.path + '.compacting', 'a', encoding='utf-8') as moved:
+				os.fsync(moved.fileno())
+
+		try:
+			with open(self.store.path, 'r', encoding='utf-8') as file:
+				data = json.load(file)
+			for (bank, channel), fields in self._compacting.items():
+				self._apply(data['presets'][f'bank_{bank}'][f'channel_{channel}'], fields)
+
+			temp = self.store.path + '.tmp'
+			with open(temp, 'w', encoding='utf-8') as file:
+				json.dump(data, file, indent=4)
+				file.flush()
+				os.fsync(file.fileno())
+			with self._storeLock:	# the old offsets don't fit the new file
+				os.replace(temp, self.store.path)
+				self.store.reindex()
+			os.remove(self.path + '.compacting')
+		finally:
+			with self._lock:
+				# on a failure the edits go back in the journal so they are in the next compaction
+				if os.path.exists(self.path + '.compacting'):
+					for (bank, channel), fields in self._compacting.items():
+						for field, value in fields.items():
+							if field in self._edits.get((bank, channel), {}): continue
+							self._file.write(json.dumps([bank, channel, field, value]) + '\n')
+							self._edits.setdefault((bank, channel), {})[field] = value
+							self._count += 1
+					self._dirty = True
+				self._compacting = {}
+				self._compactor = None
+
+	def close(self, compact: bool = True) -> None:
+		"""Stop the sync thread and close the journal.
+		Args:
+		- compact (bool)	Merge the journal into the presets file first
+		"""
+		if self._compactor is not None: self._compactor.join()
+		if compact and self._edits: self.compact()
+		self._stopEvent.set()
+		self._syncer.join()
+		self.sync()
+		self._file.close()
+
+	def _syncLoop(self) -> None:
+		while not self._stopEvent.wait(self.syncInterval):
+			self.sync()
+
+	@staticmethod
+	def _replay(path: str, edits: dict) -> int:
+		count = 0
+		try:
+			with open(path, 'r', encoding='utf-8') as file:
+				for line in file:
+					try:
+						bank, channel, field, value = json.loads(line)
+					except ValueError:
+						continue	# half written line from a crash
+					if field not in FIELDS: continue	# from before set() checked the fields
+					edits.setdefault((bank, channel), {})[field] = value
+					count += 1
+		except FileNotFoundError:
+			pass
+		return count
+
+	@staticmethod
+	def _apply(preset: dict, fields: dict) -> None:
+		for field, value in fields.items():
+			if field in ('name', 'color'):	preset[field] = value
+			else:							preset[field]['value'] = value
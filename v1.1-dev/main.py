@@ -1,19 +1,25 @@
-import argparse
-import json
-import platform
 import time
-from dataclasses import dataclass
+STARTED = time.perf_counter()	# for the startup time breakdown
 
-import keyboard
-import pygame
-import pygame.midi
-from termcolor import colored
+import os
+import threading
+from array import array
+from collections import deque
+
+from animation import Timeline
+from encoders import Acceleration, EncoderBank
+from bridge import Bridge
+from transport import PygameTransport
+from universe import CHANNELS, toMidi
 
 # import helper data/constants/functions
-from helper import SEGMENTS, COLORS, MIDITYPES, centerString 	 
+from helper import SEGMENTS, COLORS, MIDITYPES, MIDINAMES, UNMERGED, LED, MOTOR, DISPLAY, BANKS, ABSOLUTE, centerString 	 
 		# - 7-segment display chars
 		# - backlight colors
 		# - midi message types
+		# - midi status byte to message type
+		# - control changes that are never coalesced
+		# - outbound priority classes
 		# - string centering function
 
 
@@ -22,61 +28,226 @@ from helper import SEGMENTS, COLORS, MIDITYPES, centerString
 # main classes
 
 class MidiDevice:
-	_output: pygame.midi.Output
-	_input: pygame.midi.Input
+	_output: 'pygame.midi.Output'
+	_input: 'pygame.midi.Input'
 	device: str
 
 	def __init__(self) -> None:
-		pass
-
-	def connect(self, ipPort, opPort) -> None:
+		self._outQueues = [{}, {}, {}]					# messages waiting for the next flushMidi(), per priority class: {key: (message, origin)}
+		self.superseded = 0								# number of queued messages that were replaced before they were send
+		self.bandwidth = None							# bytes per second of the link, None for unlimited (a 5-pin midi cable is 3125)
+		self.burst = 256								# bytes that can be send at once after the link was idle
+		self._credit = self.burst
+		self._lastRefill = time.perf_counter()
+		self.batchSizes = deque(maxlen=100)				# number of events in each of the last send batches
+		self.writer = None								# executor that does the port writes, None to write on the calling thread
+		self.latency = None								# Latency to record the in→out latency of the send messages in
+		self.coalesceWindow = 10						# ms, a control change is dropped if the same control has a newer value within this time, 0 to disable
+		self.unmerged = frozenset()						# controllers that are never coalesced
+		self.coalesced = 0								# number of dropped (superseded) control changes
+		self.readSize = 64								# events per Input.read call
+		self.drainCap = 1024							# max events read per getData call, the rest is left for the next call
+		self.backlog = 0								# number of getData calls in a row that stopped at drainCap
+		self.backlogWarning = 20						# warn when the input stays backed up for this many calls in a row
+		self.maxDrained = 0								# most events read in one getData call
+		self._outLock = threading.Lock()
+		self._portLock = threading.Lock()						# the writer thread and the midi clock share the output port
+
+	def connect(self, ipPort, opPort, transport = None) -> None:
+		"""Open the input and output port.
+		Args:
+		- ipPort, opPort			The input and output port
+		- transport (Transport)	Where the ports come from, the real MIDI ports (PygameTransport) if not given
+		"""
 		self.ipPort, self.opPort = ipPort, opPort
-		self._input  = pygame.midi.Input (ipPort)
-		self._output = pygame.midi.Output(opPort)
+		self.transport = transport if transport is not None else PygameTransport()
+		self._input  = self.transport.openInput (ipPort)
+		self._output = self.transport.openOutput(opPort)
 
 	def close(self) -> None:
 		self._input .close()
 		self._output.close()
 
-	def _sendMidi(self, type: str, data: list) -> None:
+	def _sendMidi(self, type: str, data: list, priority: int = None) -> None:
+		"""Queue a MIDI message, it is send with the next flushMidi().
+		A queued message for the same note/control is replaced, only the newest value is send.
+		Args:
+		- type     (str)	Type of the MIDI message ('note_on', 'note_off', 'control_change', 'sysex')
+		- data     (list)	A list of bytes to send to the MIDI controller
+		- priority (int)	Priority class (LED, MOTOR, DISPLAY), by default LED for notes and MOTOR for control changes
+		"""
 		if type.lower() == 'sysex':
 			self._sendSysex(data)
-		else:
-			try:
-				self._output.write([[[MIDITYPES[type.lower()], *data], pygame.midi.time()]])
-			except:
-				self.error(f'midi data <{[type, *data]}> not send')
-	
-	def _sendSysex(self, data: bytes) -> None:
-		"""Send a SysEx message to the MIDI controller.
+			return
+		try:
+			status = MIDITYPES[type.lower()]
+		except KeyError:
+			self.error(f'midi data <{[type, *data]}> not send')
+			return
+		isNote = status & 0xf0 in (0x80, 0x90)
+		if priority is None: priority = LED if isNote else MOTOR
+		# note on and off of the same note replace each other (a led is either on or off)
+		key = (0x90 | status & 0x0f if isNote else status, *data[:1])
+		self._queue(priority, key, [status, *data])
+
+	def _sendSysex(self, data: bytes, key = None, priority: int = DISPLAY, origin = None) -> None:
+		"""Queue a SysEx message, it is send with the next flushMidi().
 		Used in for example updating the 7-segment displays and LCD-Scribble-strips.
 		Args:
-		- data (bytes)	The data you want to send to the MIDI controller
+		- data     (bytes)	The data you want to send to the MIDI controller
+		- key				Queued sysex with the same key is replaced (for example the display number), None to never replace
+		- priority (int)	Priority class, DISPLAY by default
+		- origin			The (device, arrival_ns) of the input that caused it, None for the input being handled now
+		"""
+		self._queue(priority, ('sysex', key if key is not None else object()), data, origin)
+
+	def _queue(self, priority: int, key, message, origin = None) -> None:
+		if origin is None and self.latency is not None: origin = self.latency.current
+		with self._outLock:
+			queue = self._outQueues[priority]
+			if key in queue: self.superseded += 1
+			queue[key] = (message, origin)	# a replaced message keeps its place in the queue
+
+	@property
+	def queued(self) -> int:
+		"""Number of messages waiting to be send."""
+		return sum(len(queue) for queue in self._outQueues)
+
+	def flushMidi(self, limit: bool = True) -> int:
+		"""Send the queued MIDI messages, highest priority class first, within the link bandwidth.
+		The messages that don't fit are left for the next flush. Short messages are send
+		in as few Output.write calls as possible (up to 1024 events per call), in the order they were queued.
+		Args:
+		- limit (bool)	Keep to the bandwidth, False sends everything (for example on shutdown)
+		Returns:
+		- (int)	The number of messages send
+		"""
+		if not any(self._outQueues): return 0
+		if self.bandwidth and limit:
+			now = time.perf_counter()
+			self._credit = min(self.burst, self._credit + (now - self._lastRefill) * self.bandwidth)
+			self._lastRefill = now
+			credit = self._credit
+		else:
+			credit = float('inf')
+
+		short, sysex = [], []
+		with self._outLock:
+			for queue in self._outQueues:
+				while queue and credit > 0:		# the last message may go over the credit, it is paid back on the next refills
+					message, origin = queue.pop(next(iter(queue)))
+					credit -= len(message)
+					(short if message[0] != 0xf0 else sysex).append((message, origin))
+				if credit <= 0: break
+		if self.bandwidth and limit: self._credit = credit
+
+		now = self.transport.time()
+		for i in range(0, len(short), 1024):
+			batch = short[i:i + 1024]
+			self._write([origin for _, origin in batch], self._output.write, [[message, now] for message, _ in batch])
+			self.batchSizes.append(len(batch))
+		for message, origin in sysex:
+			self._write([origin], self._output.write_sys_ex, now, message)
+		return len(short) + len(sysex)
+
+	def _write(self, origins: list, write, *args) -> None:
+		"""Do a (blocking) write to the output port, on the writer thread if the device has one.
+		Args:
+		- origins (list)		(source, arrival) of the written messages, to record their latency
+		- write   (callable)	The output port method to call
+		- args					The arguments for that method
 		"""
-		self._output.write_sys_ex(pygame.midi.time(), data)
+		if self.writer is None: self._portWrite(origins, write, *args)
+		else:					self.writer.submit(self._portWrite, origins, write, *args)
+
+	def _portWrite(self, origins: list, write, *args) -> None:
+		try:
+			with self._portLock: write(*args)
+		except Exception as e:
+			self.error(f'Exception <{e}> raised, midi data not send')
+			return
+		if self.latency is None: return
+		now = time.perf_counter_ns()
+		for origin in origins:
+			if origin is not None: self.latency.record(f'{origin[0]}→{self.device}', now - origin[1])
+	
+	def sendRealtime(self, status: int) -> None:
+		"""Write a 1 byte realtime message (clock, start, stop) now, without the queue."""
+		self._portWrite((), self._output.write_short, status)
+
+	def poll(self) -> bool:
+		"""Returns True if there is data waiting on the input port."""
+		return self._input.poll()
 
 	def getData(self) -> list:
-		dataIn = self._input.read(10) # change if needed
-		data = [[MIDITYPES[d[0][0]], *d[0][1]] for d in dataIn]
-		return self._debounce(data) 
-
-	def _debounce(lst) -> list:
-		return [lst[i] for i in range(len(lst)) if i == 0 or lst[i] != lst[i-1]]
-		# old list comprehention below for readability and in case of broken comprehention
-		# result = []
-		# for i in range(len(lst)):
-		# 	if i == 0 or lst[i] != lst[i-1]:
-		# 		result.append(lst[i])
+		"""Read the waiting MIDI messages.
+		Returns:
+		- (list)	[type, number, value, timestamp, arrival] for every message,
+					timestamp is the pygame.midi time of the device (ms), arrival the time.perf_counter_ns() of the read
+		"""
+		dataIn = self._coalesce(self._drain())
+		arrival = time.perf_counter_ns()
+		data = [[MIDINAMES[d[0][0] & 0xf0], *d[0][1:3], d[1], arrival] for d in dataIn if d[0][0] & 0xf0 in MIDINAMES]
+		if self.latency is not None and data:
+			# time the messages waited in the input buffer of the driver, only ms resolution
+			now = self.transport.time()
+			for message in data: self.latency.record(f'{self.device} input', (now - message[3]) * 1_000_000)
+		return data
+
+	def _drain(self) -> list:
+		"""Read until the input buffer is empty or drainCap events are read, and keep the backlog metrics."""
+		dataIn = self._input.read(self.readSize)
+		while len(dataIn) < self.drainCap and self._input.poll():
+			dataIn += self._input.read(min(self.readSize, self.drainCap - len(dataIn)))
+		self.maxDrained = max(self.maxDrained, len(dataIn))
+
+		if len(dataIn) >= self.drainCap and self._input.poll():
+			self.backlog += 1
+			if self.backlog % self.backlogWarning == 0:
+				self.warning(f'Input backed up for {self.backlog} reads in a row (>{self.drainCap} events waiting), can\'t keep up.')
+		else:
+			self.backlog = 0
+		return dataIn
+
+	def _coalesce(self, dataIn: list) -> list:
+		"""Drop control changes that are superseded by a newer value of the same control (status, channel and controller)
+		within coalesceWindow ms, so only the latest fader/encoder position is handled under load.
+		Notes (buttons) and the unmerged controllers are always kept.
+		Args:
+		- dataIn (list)	Events as read from the input port, [[status, data1, data2, data3], timestamp]
+		"""
+		if not self.coalesceWindow or len(dataIn) < 2: return dataIn
+		latest = {}
+		for i, (message, _) in enumerate(dataIn):
+			if message[0] & 0xf0 == 0xb0 and message[1] not in self.unmerged:
+				latest[message[0], message[1]] = i
+		if len(latest) == len(dataIn) or not latest: return dataIn	# nothing to drop
+
+		data = []
+		for i, event in enumerate(dataIn):
+			message, timestamp = event
+			last = latest.get((message[0], message[1])) if message[0] & 0xf0 == 0xb0 else None
+			if last is not None and last != i and dataIn[last][1] - timestamp <= self.coalesceWindow:
+				self.coalesced += 1
+				continue
+			data.append(event)
+		return data
 	
 	def error(self, message: str) -> None:	# TODO docstring and comments
-		print(colored(f'ERROR   {self.device: 10}: {message}', 'white', 'on_red'))
+		from termcolor import colored	# only imported when it is needed
+		print(colored(f'ERROR   {self.device:10}: {message}', 'white', 'on_red'))
 
 	def warning(self, message: str) -> None:	# TODO docstring and comments
-		print(colored(f'WARNING {self.device: 10}: {message}', 'white', 'on_blue'))
+		from termcolor import colored
+		print(colored(f'WARNING {self.device:10}: {message}', 'white', 'on_blue'))
 
 class XTouch(MidiDevice):
 	def __init__(self) -> None:
 		super().__init__()
+		self.device = 'X-Touch'
+		self.deviceId = 0x14														# sysex device id, 0x15 for a extender
+		self.unmerged = frozenset(UNMERGED)
+		self.bandwidth = 3125														# bytes per second, like a 5-pin midi cable, the X-Touch drops data when flooded
 		self.segments = [0x00 for _ in range(12)]									# set segment display data to all clear
 		self.dots = [0b0000000, 0b00000]
 		self.stripsTop    = [[0x00 for _ in range(7)] for _ in range(8)]			# create list of 8 displays of 7 chars (top display)
@@ -86,17 +257,91 @@ class XTouch(MidiDevice):
 		self.presetsBank = 0
 		self.mode = 'channel'
 		self.leds = [0b0 for _ in range(94)]
-
-		self.encoders = [Encoder(chn) for chn in range(8)]
+		self.presets = None															# BankCache with the preset names/colors shown in presets mode
+		self.presetsFile = None														# presets json, loaded into self.presets the first time it is needed
+		self.universe = None														# DmxUniverse with the levels shown in channel mode
+		self.extenders = []															# XTouchExtenders next to this X-Touch, see addExtender()
+		self.offset = 0																# first strip of this surface in the combined width
+
+		self.encoders = EncoderBank()																# the encoder values of every channel bank
+		self.acceleration = Acceleration(8)													# step size of the encoders, see ENCODERCURVES
+
+		# display framebuffer, the update methods only mark what changed and flushDisplays() sends it
+		self.displayRate = 60														# max display flushes per second
+		self._nextFlush = 0.0																# time of the next scheduled flush
+		self._dirtyStrips = {}														# scribble strips changed since the last flush, with the origin of the oldest change
+		self._dirtySegments = False													# 7-segment digits/dots changed since the last flush
+		self._segmentsOrigin = None													# origin of the oldest change of the 7-segment displays
+		self._sentStrips = [None for _ in range(8)]									# last frame send to each scribble strip
+		self._sentSegments = None													# last frame send to the 7-segment displays
+
+	# multi surface methods
+	@property
+	def surfaces(self) -> list:
+		"""This X-Touch and its extenders, from left to right."""
+		return [self, *self.extenders]
+
+	@property
+	def width(self) -> int:
+		"""Number of strips of all surfaces together."""
+		return 8 * len(self.surfaces)
+
+	def addExtender(self, extender: 'XTouchExtender') -> None:
+		"""Add a extender on the right, its strips continue where the last surface stopped.
+		The extender is a device of its own (own ports, output queue and writer), it only follows the banks of this X-Touch.
+		"""
+		extender.offset = self.width
+		self.extenders.append(extender)
+
+	def surfaceOf(self, strip: int) -> tuple:
+		"""The (surface, display) of a strip in the combined width."""
+		return self.surfaces[strip // 8], strip % 8
+
+	# display framebuffer methods
+	def flushDisplays(self, force: bool = False) -> int:
+		"""Queue the changed 7-segment and scribble strip frames for the X-Touch (send with flushMidi).
+		Queues at most once per 1/displayRate seconds unless forced, the flushes are scheduled on a fixed grid
+		(with a quarter tick slack) so a timer tick that is a bit early after a late one is not skipped.
+		Frames that are the same as the last send frame are skipped.
+		Args:
+		- force (bool)	Flush now, even if the last flush was less than a tick ago
+		Returns:
+		- (int)	The number of sysex frames queued
+		"""
+		if not (self._dirtySegments or self._dirtyStrips): return 0
+		now = time.perf_counter()
+		period = 1 / self.displayRate
+		if not force and now < self._nextFlush - period / 4: return 0
+		self._nextFlush = max(self._nextFlush, now - period) + period	# don't catch up after a idle period
+
+		sent = 0
+		if self._dirtySegments:
+			self._dirtySegments = False
+			origin, self._segmentsOrigin = self._segmentsOrigin, None
+			frame = [0xf0, 0x00, 0x20, 0x32, self.deviceId, 0x37, *self.segments, *self.dots, 0xf7]
+			if frame != self._sentSegments:
+				try:
+					self._sendSysex(frame, 'segments', origin=origin)
+					self._sentSegments = frame
+					sent += 1
+				except Exception as e:
+					self.error(f'Exception <{e}> raised while trying to update the 7-Segment displays.')
+
+		for display, origin in sorted(self._dirtyStrips.items()):
+			frame = [0xf0, 0x00, 0x20, 0x32, self.deviceId, 0x4c, display, self.stripsBacklight[display], *self.stripsTop[display], *self.stripsBottom[display], 0xf7]
+			if frame != self._sentStrips[display]:
+				self._sendSysex(frame, ('strip', display), origin=origin)
+				self._sentStrips[display] = frame
+				sent += 1
+		self._dirtyStrips.clear()
+		return sent
 
 	# 7-Segment display methods
 	def updateSegmentDisplay(self) -> bool:
-		try:
-			self._sendSysex([0xf0, 0x00, 0x20, 0x32, 0x14, 0x37, *self.segments, *self.dots, 0xf7])
-			return True
-		except Exception as e:
-			self.error(f'Exception <{e}> raised while trying to update the 7-Segment displays.')
-			return False
+		# the frame is queued later by flushDisplays(), so remember the input that caused it for the latency
+		self._dirtySegments = True
+		if self._segmentsOrigin is None and self.latency is not None: self._segmentsOrigin = self.latency.current
+		return True
 
 	def clearSegmentDisplay(self) -> bool:
 		self.segments = [0x00 for _ in range(12)]
@@ -130,12 +375,17 @@ class XTouch(MidiDevice):
 		self.updateSegmentDisplay() # update the display to the new data
 		return True
 
+	def showTempo(self, bpm: int) -> bool:
+		# the bpm is shown on the last 3 digits
+		return self.setSegmentData(9, f'{min(bpm, 999):03d}')
+
 	# LCD Scribble strips methods
 	def updateScribbleStrip(self, display: int) -> bool:
 		if display < 0 or display > 7:
 			self.error(f'Display <{display}> out of range. (0-7)\nDisplay not updated!')
 			return False
-		self._sendSysex([0xf0, 0x00, 0x20, 0x32, 0x14, 0x4c, display, self.stripsBacklight[display], *self.stripsTop[display], *self.stripsBottom[display], 0xf7])
+		if self._dirtyStrips.get(display) is None:
+			self._dirtyStrips[display] = self.latency.current if self.latency is not None else None
 		return True
 
 	def setScibbleStripBacklight(self, display: int, color: str, invTop: bool = False, invBottom: bool = False) -> bool:
@@ -195,24 +445,64 @@ class XTouch(MidiDevice):
 	
 	# bank and mode methods
 	def updateBank(self, change: int):
-		bank = getattr(self, f'{self.mode}bank')
-		bank += change
-		if self.mode == 'presets':
-			if bank < 0 : bank = 99
-			if bank > 99: bank = 0
-		if self.mode == 'channel':
-			if bank < 0 : bank = 63
-			if bank > 63: bank = 0
-		setattr(self, f'{self.mode}bank', bank)
+		# a page shows one bank on every surface, so paging steps by the number of surfaces
+		step = len(self.surfaces)
+		pages = -(-BANKS[self.mode] // step)
+		bank = (getattr(self, f'{self.mode}Bank') // step + change) % pages * step
+		setattr(self, f'{self.mode}Bank', bank)
 		print(f'{self.mode}bank = {bank}')
 		self.setSegmentData(0, f'{bank:02d}')
+		if self.mode == 'presets':	self.showPresets()
+		else:						self.showChannels()
+
+	def showChannels(self) -> bool:
+		"""Show the encoders and levels of the current channel bank on the rings, faders and scribble strips, the next banks on the extenders."""
+		for bank, surface in enumerate(self.surfaces, self.channelBank):
+			if bank < BANKS['channel']: surface.setEncoderBank(bank)
+		if self.universe is None: return False
+		levels = self.universe.bank(self.channelBank, self.width)	# one slice for all surfaces
+		for strip in range(self.width):
+			surface, display = self.surfaceOf(strip)
+			if strip < len(levels):
+				surface.showChannel(display, self.channelBank * 8 + strip, levels[strip])
+			else:	# past the last channel
+				surface._sendMidi('control_change', [70 + display, 0])
+				surface.clearScribbleStrip(display)
+		return True
+
+	def showChannel(self, display: int, channel: int, level: int, fader: bool = True) -> bool:
+		"""Show a channel and its level on a strip of this surface.
+		Args:
+		- display (int)		The strip (0-7)
+		- channel (int)		The dmx channel (0-511)
+		- level   (int)		The level (0-255)
+		- fader   (bool)	Also move the fader, False when the fader is the one that changed the level
+		"""
+		if fader: self._sendMidi('control_change', [70 + display, toMidi(level)])
+		self.stripsBacklight[display] = COLORS['white']
+		return self.setScribbleStripData(display, f'ch {channel + 1}', f'{level}')
+
+	def showPresets(self) -> bool:
+		"""Show the names and colors of the current presets bank on the scribble strips, the next banks on the extenders."""
+		if self.presets is None:
+			if self.presetsFile is None: return False
+			from presets import BankCache, PresetStore
+			self.presets = BankCache(PresetStore(self.presetsFile), prefetch=len(self.surfaces))
+		for bank, surface in enumerate(self.surfaces, self.presetsBank):
+			if bank >= BANKS['presets']:	# the last page isn't full
+				surface.resetScribbleStrips()
+				continue
+			for display, (name, color) in enumerate(self.presets.get(bank)):
+				surface.setScibbleStripBacklight(display, color)
+				surface.setScribbleStripData(display, name, f'{bank * 8 + display + 1}')
+		return True
 
 	def setBankNr(self, number: int, bank: str = None):
 		# if bank specified set that bank to number
-		if bank: setattr(self, f'{bank}bank', 	   number)
-		else:	 setattr(self, f'{self.mode}bank', number)
+		if bank: setattr(self, f'{bank}Bank', 	   number)
+		else:	 setattr(self, f'{self.mode}Bank', number)
 
-		self.setSegmentData(0, f'{getattr(self, f"{self.mode}bank"):02d}')
+		self.setSegmentData(0, f'{getattr(self, f"{self.mode}Bank"):02d}')
 
 	def updateMode(self, mode: str):
 		if mode in ['channel', 'presets']: 
@@ -221,11 +511,31 @@ class XTouch(MidiDevice):
 			case 'channel':
 				self.ledOn (86)
 				self.ledOff(87)
+				self.showChannels()
 			case 'presets':
 				self.ledOn (87)
 				self.ledOff(86)
-		self.setSegmentData(0, f'{getattr(self, f"{self.mode}bank"):02d}{self.mode:7}')
+				self.showPresets()
+		self.setSegmentData(0, f'{getattr(self, f"{self.mode}Bank"):02d}{self.mode:7}')
 	
+	# encoder and jog wheel methods
+	def turnEncoder(self, encoder: int, value: int, timestamp: int = 0):
+		# relative encoders send 65 when turned right and 1 when turned left
+		if self.encoders.mode(encoder) == ABSOLUTE:	self.encoders.set(encoder, value)
+		else:										self.encoders.add(encoder, self.acceleration.step(encoder, 1 if value == 65 else -1, timestamp))
+		self.showRing(encoder)
+
+	def showRing(self, encoder: int):
+		if self.encoders.ringMoved(encoder):	# most steps don't move the led ring
+			self._sendMidi('control_change', [encoder + 80, self.encoders.get(encoder)])
+
+	def setEncoderBank(self, bank: int):
+		self.encoders.setBank(bank)
+		for encoder in range(8): self.showRing(encoder)
+
+	def jogWheel(self, value: int):
+		self.updateBank(1 if value == 65 else -1)
+
 	# LED methods
 
 	def ledOn(self, *leds):
@@ -239,6 +549,7 @@ class XTouch(MidiDevice):
 	def ledAllOn(self):
 		for i in range(94):
 			self.ledOn(i)
+		self.flushMidi()
 
 	def ledOff(self, *leds):
 		for led in leds:
@@ -251,6 +562,7 @@ class XTouch(MidiDevice):
 	def ledAllOff(self):
 		for i in range(94):
 			self.ledOff(i)
+		self.flushMidi()
 
 	def ledToggle(self, *leds):
 		for led in leds:
@@ -261,58 +573,104 @@ class XTouch(MidiDevice):
 		for i in range(119):
 			self._sendMidi('note_on', [i, 0])
 			self._sendMidi('control_change', [i, 0])
+		self.encoders.forgetRings()	# the led rings are off now
+		self.flushMidi()
 	
-	def startUpSequence(self):
-		self.ledAllOn()
+	def startUpAnimation(self) -> Timeline:
+		"""The startup animation as a Timeline, play it with Bridge.play() so the input keeps working."""
+		timeline = Timeline(self)
+		timeline.at(0, self.ledAllOn)
 		for i in range(20):
-			self._sendMidi('control_change', [i + 70, 127])
-			time.sleep(.05)
-		self.setSegmentData(0, '0123456789ab')
+			timeline.fader(i * .05, i, 127)
+		timeline.segments(1, 0, '0123456789ab')
 		for i, c in enumerate(list(COLORS.keys())[1:]):
-			self.setScibbleStripBacklight(i, c)
-			self.setScribbleStripData(i, 'Display', f'{i}')
-		time.sleep(2)
-		self.resetControls()
-		self.clearSegmentDisplay()
-		self.resetScribbleStrips()
+			timeline.strip(1, i, 'Display', f'{i}', c)
+		timeline.at(3, self.resetControls)
+		timeline.at(3, self.clearSegmentDisplay)
+		timeline.at(3, self.resetScribbleStrips)
+		timeline.at(3, lambda: self.updateMode(self.mode))	# show the mode and bank of when it ends, they can change while it plays
+		return timeline
+
+	def startUpSequence(self):
+		"""Play the startup animation blocking, use startUpAnimation() when the Bridge is running."""
+		self.startUpAnimation().play(flush=self.flush)
+		for surface in self.surfaces:
+			surface.flushDisplays(force=True)
+			surface.flushMidi(limit=False)
+
+	def flush(self):
+		for surface in self.surfaces:
+			surface.flushDisplays()
+			surface.flushMidi()
 	
 	# 
 
+class XTouchExtender(XTouch):
+	"""A X-Touch Extender, 8 more strips (faders, encoders and scribble strips) without the 7-segment displays and bank/mode buttons.
+	Add it to the X-Touch with XTouch.addExtender(), the X-Touch decides what it shows.
+	Args:
+	- number (int)	Number of the extender, for the device name
+	"""
+	def __init__(self, number: int = 1) -> None:
+		super().__init__()
+		self.device = f'X-Ext {number}'
+		self.deviceId = 0x15
+
 class MyDmx3(MidiDevice):
 	def __init__(self) -> None:
 		super().__init__()
+		self.device = 'MyDMX'
+		self.universe = None														# DmxUniverse to send, see flushUniverse()
+		self.chunkSize = 64															# channels per compare in flushUniverse()
+		self._sentLevels = None														# snapshot of the levels MyDMX has
 
 	# def togglePreset(self):
 	# 	...
 
-	def setChannel(self, channel, value):
-		self._sendMidi('control_change', [])
-
-
-
-# helper classes
+	def setChannel(self, channel: int, level: int, universe: int = 0) -> None:
+		"""Queue the level of a dmx channel for MyDMX.
+		Every channel is a control change, 128 channels per midi channel (channel 0-127 on midi channel 1, 128-255 on 2, ...)
+		so a universe uses 4 midi channels and up to 4 universes fit.
+		Args:
+		- channel  (int)	The dmx channel (0-511)
+		- level    (int)	The level (0-255), send as 7-bit value
+		- universe (int)	The universe
+		"""
+		number = universe * CHANNELS + channel
+		status = MIDITYPES['control_change'] | number >> 7
+		self._queue(MOTOR, (status, number & 0x7f), [status, number & 0x7f, toMidi(level)])
+
+	def flushUniverse(self) -> int:
+		"""Queue the channels of the universe that changed since the last call (send with flushMidi).
+		The levels are compared with a snapshot of what was send: first the whole buffer at once,
+		if that differs in chunks of chunkSize channels and only the changed chunks channel by channel.
+		So a bulk change (a bank recall, all faders to zero) only costs midi for the channels that really changed.
+		Returns:
+		- (int)	The number of channels queued
+		"""
+		if self.universe is None: return 0
+		levels, sent = self.universe.levels, self._sentLevels
+		if sent is None or len(sent) != len(levels):
+			sent = self._sentLevels = array('B', bytes(len(levels)))	# MyDMX starts with every channel at 0
+		if levels == sent: return 0
 
-class Encoder:
-	value: int
-	channel: int
+		queued, chunk = 0, self.chunkSize
+		for start in range(0, len(levels), chunk):
+			if levels[start:start + chunk] == sent[start:start + chunk]: continue
+			for number in range(start, min(start + chunk, len(levels))):
+				level = levels[number]
+				if level == sent[number]: continue
+				sent[number] = level
+				self.setChannel(number % CHANNELS, level, number // CHANNELS)
+				queued += 1
+		return queued
 
-	def __init__(self, channel) -> None:
-		self.channel = channel
-		self.value = 0
 
-	def updateValue(self, value):
-		self.value += value
-		
-	def getValue(self):
-		return self.value
-	
-	def __str__(self) -> str:
-		return f'ENCODER instance, channel = {self.channel}, value = {self.value}'
 
-	def __repr__(self) -> str:
-		return f'ENCODER({self.channel}, {self.value})'
+# helper functions
 
 def setupMidi() -> tuple:
+	import pygame.midi
 	dev_count = pygame.midi.get_count()
 	if dev_count == 0: print('No MIDI devices found, exiting program.'); exit()
 
@@ -338,23 +696,59 @@ def setupMidi() -> tuple:
 
 class Main():
 	def __init__(self) -> None:
-		pass
+		self.timings = [('start', STARTED)]
+		self.extenderPorts = []		# (input, output) port of every X-Touch Extender, from left to right
+
+	def _mark(self, step: str) -> None:
+		self.timings.append((step, time.perf_counter()))
+
+	def printStartupTimes(self) -> None:
+		times = [(step, end - start) for (_, start), (step, end) in zip(self.timings, self.timings[1:])]
+		print('Startup: ' + ', '.join(f'{step} {seconds * 1000:.1f} ms' for step, seconds in times) + f' (total {sum(s for _, s in times) * 1000:.1f} ms)')
 
 	def go(self):
+		import platform
 		if platform.system() == 'Windows':
 			from colorama import just_fix_windows_console
 			just_fix_windows_console()
 
 		# args = setupArgparse()
 		# ports = setupMidi()
+		self._mark('imports')
 
-		pygame.init()
-		pygame.midi.init()
-
+		# only the midi part of pygame, display/audio/joystick are never used
+		transport = PygameTransport()
+		transport.init()
+		self._mark('midi init')
 
 		xt = XTouch()
-		xt.connect(1, 6)
-		xt.startUpSequence()
+		md = MyDmx3()
+		xt.presetsFile = os.path.join(os.path.dirname(__file__), '..', 'presets', 'presets.json')
+		xt.connect(1, 6, transport)
+		md.connect(4, 8, transport)
+		for number, (ipPort, opPort) in enumerate(self.extenderPorts, 1):
+			extender = XTouchExtender(number)
+			extender.connect(ipPort, opPort, transport)
+			xt.addExtender(extender)
+		self._mark('connect')
+		try:
+			xt.mode = 'channel'
+			bridge = Bridge(xt, md)
+			bridge.play(xt.startUpAnimation())
+			self._mark('ready')
+			self.printStartupTimes()
+			bridge.run()
+		finally:
+			if xt.presets is not None: xt.presets.close()
+			xt.clearSegmentDisplay()
+			for surface in xt.surfaces:
+				surface.resetControls()
+				surface.resetScribbleStrips()
+				surface.flushDisplays(force=True)
+				surface.flushMidi(limit=False)
+				surface.close()
+			md.close()
+			transport.quit()
 
 
 
@@ -0,0 +1,324 @@
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# import helper data/constants/functions
+from helper import COLORS
+		# - backlight colors
+
+# strings (so braces in preset names are skipped) and object braces
+_TOKENS = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}]')
+
+# binary preset file layout, see BinaryPresets
+MAGIC = b'MMEP'
+HEADER = struct.Struct('<4sHHH6x')				# magic, version, banks, channels per bank (16 bytes)
+RECORD = struct.Struct('<16sBB4B8B2x')			# name, color, buttons, values, midi channels (32 bytes)
+NAMESIZE = 16									# max bytes of a utf-8 encoded name in a record
+COLORNAMES = list(COLORS)
+CONTROLS = ('encoder', 'encoder_led', 'led_bar', 'fader')				# controls with a 0-127 value
+BUTTONS = ('button_1', 'button_2', 'button_3', 'button_4')			# controls with a on/off value
+NOCHANNEL = 0xff														# control has no midi channel (old schema)
+
+
+class PresetStore:
+	"""Lazy access to a presets json file (see presets/create_presets.py for the layout).
+	The byte offsets of every bank_N object are indexed once and cached next to the file (<file>.idx),
+	after that only the banks that are asked for are read and parsed.
+	Args:
+	- path (str)	Path to the presets json file
+	"""
+	def __init__(self, path: str) -> None:
+		self.path = path
+		self.indexPath = path + '.idx'
+		self.index = self._loadIndex()
+
+	def __len__(self) -> int:
+		return len(self.index)
+
+	def __contains__(self, bank: int) -> bool:
+		return bank in self.index
+
+	def getBank(self, bank: int) -> dict:
+		"""Read and parse one bank.
+		Args:
+		- bank (int)	The bank number
+		Returns:
+		- (dict)	{'channel_0': {...}, 'channel_1': {...}, ...}
+		"""
+		start, end = self.index[bank]
+		with open(self.path, 'rb') as file:
+			file.seek(start)
+			return json.loads(file.read(end - start))
+
+	def getChannel(self, bank: int, channel: int) -> dict:
+		return self.getBank(bank)[f'channel_{channel}']
+
+	def reindex(self) -> None:
+		"""Rebuild the index, needed when the file is changed while the store is open."""
+		self.index = self._buildIndex()
+		self._saveIndex()
+
+	def _stat(self) -> list:
+		stat = os.stat(self.path)
+		return [stat.st_size, stat.st_mtime_ns]
+
+	def _loadIndex(self) -> dict:
+		try:
+			with open(self.indexPath, 'r') as file:
+				cached = json.load(file)
+			if cached['stat'] == self._stat():
+				return {int(bank): tuple(offsets) for bank, offsets in cached['banks'].items()}
+		except (OSError, ValueError, KeyError):
+			pass	# no (valid) index yet
+		index = self._buildIndex()
+		self.index = index
+		self._saveIndex()
+		return index
+
+	def _saveIndex(self) -> None:
+		try:
+			with open(self.indexPath, 'w') as file:
+				json.dump({'stat': self._stat(), 'banks': self.index}, file)
+		except OSError:
+			pass	# read only location, the index is rebuild the next time
+
+	def _buildIndex(self) -> dict:
+		# depth 1 is the root object, depth 2 the "presets" object and depth 3 a bank
+		with open(self.path, 'rb') as file:
+			data = file.read()
+		index = {}
+		depth, key, start = 0, None, 0
+		for match in _TOKENS.finditer(data):
+			token = match.group()
+			if token == b'{':
+				depth += 1
+				if depth == 3: start = match.start()
+			elif token == b'}':
+				if depth == 3 and key.startswith('bank_'):
+					index[int(key[5:])] = (start, match.end())
+				depth -= 1
+			elif depth == 2:
+				key = token[1:-1].decode()	# the only strings at this depth are the bank keys
+		return index
+
+
+class Preset:
+	"""Read only view on one record of a BinaryPresets file, nothing is copied until a field is read.
+	Args:
+	- data   (mmap)	The mapped file
+	- offset (int)	Offset of the record in the file
+	- number (int)	The preset number
+	"""
+	__slots__ = ('_data', '_offset', 'number')
+
+	def __init__(self, data, offset: int, number: int) -> None:
+		self._data = data
+		self._offset = offset
+		self.number = number
+
+	@property
+	def name(self) -> str:
+		return self._data[self._offset:self._offset + 16].rstrip(b'\0').decode('utf-8', 'ignore')
+
+	@property
+	def color(self) -> str:
+		return COLORNAMES[self._data[self._offset + 16]]
+
+	@property
+	def buttons(self) -> tuple:
+		flags = self._data[self._offset + 17]
+		return tuple(bool(flags >> i & 1) for i in range(4))
+
+	@property
+	def encoder(self) -> int:		return self._data[self._offset + 18]
+	@property
+	def encoderLed(self) -> int:	return self._data[self._offset + 19]
+	@property
+	def ledBar(self) -> int:		return self._data[self._offset + 20]
+	@property
+	def fader(self) -> int:			return self._data[self._offset + 21]
+
+	@property
+	def channels(self) -> tuple:
+		"""Midi channels of encoder, encoder_led, led_bar, fader and button_1-4, NOCHANNEL if not set."""
+		return tuple(self._data[self._offset + 22:self._offset + 30])
+
+	def toDict(self) -> dict:
+		"""The preset in the json layout of presets.json."""
+		preset = {'name': self.name, 'color': self.color}
+		values = (self.encoder, self.encoderLed, self.ledBar, self.fader, *self.buttons)
+		for control, value, channel in zip(CONTROLS + BUTTONS, values, self.channels):
+			preset[control] = {'value': value} if channel == NOCHANNEL else {'channel': channel, 'value': value}
+		# keep the key order of presets.json
+		return {key: preset[key] for key in ('name', 'color', 'encoder', 'encoder_led', 'led_bar', *BUTTONS, 'fader')}
+
+	def __repr__(self) -> str:
+		return f'Preset({self.number}, {self.name!r}, {self.color!r})'
+
+
+class BinaryPresets:
+	"""Memory mapped binary presets file.
+	A 16 byte header followed by fixed size 32 byte records, bank after bank:
+	- name (16 bytes utf-8), color (index in COLORS), buttons (bit 0-3)
+	- encoder, encoder_led, led_bar and fader value
+	- midi channel of encoder, encoder_led, led_bar, fader and button_1-4 (NOCHANNEL if not set)
+	Opening maps the file, the presets are only read when a Preset field is used.
+	Args:
+	- path (str)	Path to the binary presets file
+	"""
+	def __init__(self, path: str) -> None:
+		self.path = path
+		with open(path, 'rb') as file:
+			self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		magic, self.version, self.banks, self.channels = HEADER.unpack_from(self._data)
+		if magic != MAGIC:
+			self.close()
+			raise ValueError(f'<{path}> is not a binary presets file.')
+
+	def __len__(self) -> int:
+		return self.banks
+
+	def getPreset(self, bank: int, channel: int) -> Preset:
+		if not 0 <= bank < self.banks or not 0 <= channel < self.channels:
+			raise IndexError(f'Preset <{bank}, {channel}> out of range. (0-{self.banks - 1}, 0-{self.channels - 1})')
+		number = bank * self.channels + channel
+		return Preset(self._data, HEADER.size + number * RECORD.size, number + 1)
+
+	def getBank(self, bank: int) -> list:
+		return [self.getPreset(bank, channel) for channel in range(self.channels)]
+
+	def close(self) -> None:
+		self._data.close()
+
+
+class BankCache:
+	"""LRU cache of decoded, display ready banks with background prefetching of the neighbour banks.
+	Every bank is a list of (name, color) tuples, one for every channel.
+	Args:
+	- source   (PresetStore | BinaryPresets)	Where the banks are loaded from
+	- size     (int)							Max number of banks to keep
+	- prefetch (int)							Number of banks on each side of the requested bank to load in the background
+	"""
+	def __init__(self, source, size: int = 16, prefetch: int = 1) -> None:
+		self.source = source
+		self.size = size
+		self.prefetch = prefetch
+		self.hits = self.misses = 0
+		self._banks = OrderedDict()
+		self._loading = {}										# bank: future of the banks that are being prefetched
+		self._lock = threading.Lock()
+		self._executor = ThreadPoolExecutor(1, thread_name_prefix='prefetch')
+
+	def get(self, bank: int) -> list:
+		"""Get a bank and start prefetching its neighbours.
+		Args:
+		- bank (int)	The bank number
+		Returns:
+		- (list)	[(name, color), ...] for every channel of the bank
+		"""
+		with self._lock:
+			decoded = self._banks.get(bank)
+			if decoded is not None:
+				self._banks.move_to_end(bank)
+				self.hits += 1
+			else:
+				self.misses += 1
+			future = self._loading.get(bank)
+		if decoded is None:
+			decoded = future.result() if future is not None else self._load(bank)
+		self._prefetch(bank)
+		return decoded
+
+	def close(self) -> None:
+		self._executor.shutdown(wait=False, cancel_futures=True)
+
+	def _prefetch(self, bank: int) -> None:
+		banks = len(self.source)
+		for step in range(1, self.prefetch + 1):
+			for neighbour in ((bank + step) % banks, (bank - step) % banks):
+				with self._lock:
+					if neighbour in self._banks or neighbour in self._loading: continue
+					self._loading[neighbour] = self._executor.submit(self._load, neighbour)
+
+	def _load(self, bank: int) -> list:
+		try:
+			decoded = self._decode(self.source.getBank(bank))
+			with self._lock:
+				self._banks[bank] = decoded
+				self._banks.move_to_end(bank)
+				while len(self._banks) > self.size: self._banks.popitem(last=False)
+			return decoded
+		finally:
+			with self._lock: self._loading.pop(bank, None)
+
+	@staticmethod
+	def _decode(bank) -> list:
+		if isinstance(bank, dict):	# PresetStore bank
+			return [(bank[f'channel_{channel}']['name'], bank[f'channel_{channel}']['color']) for channel in range(len(bank))]
+		return [(preset.name, preset.color) for preset in bank]
+
+
+def jsonToBinary(source: str, destination: str) -> None:
+	"""Convert a presets json file to the binary format.
+	Args:
+	- source      (str)	The presets json file
+	- destination (str)	The binary file to create
+	Raises:
+	- ValueError	If a name is longer than NAMESIZE bytes as utf-8, it would not come back the same
+	"""
+	store = PresetStore(source)
+	banks = sorted(store.index)
+	channels = len(store.getBank(banks[0])) if banks else 0
+	try:
+		with open(destination, 'wb') as file:
+			file.write(HEADER.pack(MAGIC, 1, len(banks), channels))
+			for bank in banks:
+				data = store.getBank(bank)
+				for channel in range(channels):
+					preset = data[f'channel_{channel}']
+					name = preset['name'].encode('utf-8')
+					if len(name) > NAMESIZE:
+						raise ValueError(f"Name <{preset['name']}> of bank {bank} channel {channel} is {len(name)} bytes, max {NAMESIZE} (utf-8).")
+					buttons = sum(bool(preset[button]['value']) << i for i, button in enumerate(BUTTONS))
+					file.write(RECORD.pack(
+						name,
+						COLORNAMES.index(preset['color'].lower()),
+						buttons,
+						*[preset[control]['value'] for control in CONTROLS],
+						*[preset[control].get('channel', NOCHANNEL) for control in CONTROLS + BUTTONS]))
+	except Exception:
+		if os.path.exists(destination): os.remove(destination)	# no half written file
+		raise
+
+def binaryToJson(source: str, destination: str) -> None:
+	"""Convert a binary presets file back to the json layout of presets.json.
+	Args:
+	- source      (str)	The binary presets file
+	- destination (str)	The json file to create
+	"""
+	presets = BinaryPresets(source)
+	try:
+		data = {}
+		for bank in range(presets.banks):
+			data[f'bank_{bank}'] = {f'channel_{channel}': preset.toDict() for channel, preset in enumerate(presets.getBank(bank))}
+	finally:
+		presets.close()
+	with open(destination, 'w') as file:
+		json.dump({'presets': data}, file, indent=4)
+
+
+
+if __name__ == '__main__':
+	import argparse
+	parser = argparse.ArgumentParser(description=f'convert presets between the json and binary format (names of max {NAMESIZE} utf-8 bytes)')
+	parser.add_argument('source')
+	parser.add_argument('destination')
+	parser.add_argument('-r', '--reverse', action='store_true', help='convert binary to json')
+	args = parser.parse_args()
+	if args.reverse:	binaryToJson(args.source, args.destination)
+	else:				jsonToBinary(args.source, args.destination)
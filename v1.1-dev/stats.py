@@ -0,0 +1,84 @@
+import threading
+
+
+class LatencyHistogram:
+	"""HDR style histogram of latencies in nanoseconds.
+	Values are stored in log-linear buckets with 2**precision sub buckets per power of 2,
+	so every recorded value is kept with a relative error of at most 1/2**(precision-1), whatever its size.
+	Args:
+	- precision (int)	Number of significant bits per value
+	"""
+	def __init__(self, precision: int = 7) -> None:
+		self.precision = precision
+		self.counts = {}
+		self.count = 0
+		self.total = 0
+		self.min = None
+		self.max = 0
+
+	def record(self, value: int) -> None:
+		value = max(0, int(value))
+		shift = max(0, value.bit_length() - self.precision)
+		bucket = (shift << self.precision) + (value >> shift)
+		self.counts[bucket] = self.counts.get(bucket, 0) + 1
+		self.count += 1
+		self.total += value
+		if self.min is None or value < self.min: self.min = value
+		if value > self.max: self.max = value
+
+	def percentile(self, percent: float) -> int:
+		"""The value (in ns) below which percent of the recorded values are."""
+		if not self.count: return 0
+		needed = max(1, round(self.count * percent / 100))
+		seen = 0
+		for bucket in sorted(self.counts):
+			seen += self.counts[bucket]
+			if seen >= needed:
+				shift, sub = bucket >> self.precision, bucket & ((1 << self.precision) - 1)
+				return min((sub << shift) + (1 << shift >> 1), self.max)	# middle of the bucket
+		return self.max
+
+	def summary(self) -> dict:
+		"""count, mean, p50, p99, p99.9 and max, the latencies are in microseconds."""
+		return {
+			'count': self.count,
+			'mean': self.total / self.count / 1000 if self.count else 0,
+			'p50': self.percentile(50) / 1000,
+			'p99': self.percentile(99) / 1000,
+			'p99.9': self.percentile(99.9) / 1000,
+			'max': self.max / 1000}
+
+	def clear(self) -> None:
+		self.__init__(self.precision)
+
+
+class Latency:
+	"""Latency histograms per route (for example 'X-Touch→MyDMX').
+	The bridge sets current to (source, arrival) while it handles a read from source,
+	the devices take it with every message they queue and record the latency after the message is written.
+	"""
+	def __init__(self) -> None:
+		self.routes = {}
+		self.current = None										# (source device, arrival time in perf_counter_ns)
+		self._lock = threading.Lock()
+
+	def record(self, route: str, value: int) -> None:
+		with self._lock:
+			histogram = self.routes.get(route)
+			if histogram is None: histogram = self.routes[route] = LatencyHistogram()
+			histogram.record(value)
+
+	def summary(self) -> dict:
+		"""{route: LatencyHistogram.summary()} for every route."""
+		with self._lock:
+			return {route: histogram.summary() for route, histogram in self.routes.items()}
+
+	def report(self) -> str:
+		lines = [f'{"route":24} {"count":>9} {"p50 us":>9} {"p99 us":>9} {"p99.9 us":>9} {"max us":>9}']
+		for route, summary in sorted(self.summary().items()):
+			lines.append(f'{route:24} {summary["count"]:9} {summary["p50"]:9.1f} {summary["p99"]:9.1f} {summary["p99.9"]:9.1f} {summary["max"]:9.1f}')
+		return '\n'.join(lines)
+
+	def clear(self) -> None:
+		with self._lock:
+			self.routes.clear()
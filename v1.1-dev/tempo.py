@@ -0,0 +1,58 @@
+from array import array
+from statistics import median
+
+
+class TapTempo:
+	"""Tap tempo from the timestamps of the taps.
+	The last size taps are kept in a ring buffer. Intervals that differ more than tolerance from the median
+	are ignored, the bpm of the other intervals is smoothed with a exponential moving average.
+	A pause longer than maxInterval starts a new tempo.
+	Nothing is drawn here, the bridge shows bpm on the X-Touch from a timer.
+	Args:
+	- size        (int)			Number of taps to keep
+	- maxInterval (float)		Seconds after which a tap starts a new tempo
+	- tolerance   (float)		Max relative difference from the median interval
+	- smoothing   (float)		Weight of a new measurement in the moving average (0-1, 1 is no smoothing)
+	"""
+	def __init__(self, size: int = 8, maxInterval: float = 2.0, tolerance: float = 0.2, smoothing: float = 0.5) -> None:
+		self.size = size
+		self.maxInterval = maxInterval
+		self.tolerance = tolerance
+		self.smoothing = smoothing
+		self.bpm = 0.0
+		self.confidence = 0.0									# 0-1, how consistent (and how many) the taps are
+		self._taps = array('d', bytes(8 * size))
+		self._count = 0
+		self._index = 0
+
+	def tap(self, timestamp: float) -> float:
+		"""Add a tap.
+		Args:
+		- timestamp (float)	Time of the tap in seconds (the midi event timestamp, not the time it was handled)
+		Returns:
+		- (float)	The bpm, 0 if it is not known yet
+		"""
+		if self._count and not 0 < timestamp - self._taps[self._index - 1] <= self.maxInterval:
+			self._count = 0		# too long since the last tap (or the clock jumped), start over
+		self._taps[self._index] = timestamp
+		self._index = (self._index + 1) % self.size
+		self._count = min(self._count + 1, self.size)
+		if self._count < 2: return self.bpm
+
+		taps = [self._taps[(self._index - self._count + i) % self.size] for i in range(self._count)]
+		intervals = [later - earlier for earlier, later in zip(taps, taps[1:])]
+		middle = median(intervals)
+		inliers = [interval for interval in intervals if abs(interval - middle) <= self.tolerance * middle]
+		self.confidence = len(inliers) / len(intervals) * min(1.0, len(intervals) / 4)
+		if not inliers: return self.bpm		# only 2 intervals that disagree, wait for the next tap to tell which one is right
+		measured = 60 * len(inliers) / sum(inliers)
+
+		if self._count == 2 or not self.bpm:	self.bpm = measured
+		else:									self.bpm += self.smoothing * (measured - self.bpm)
+
+		return self.bpm
+
+	def reset(self) -> None:
+		self._count = 0
+		self.bpm = 0.0
+		self.confidence = 0.0
@@ -0,0 +1,181 @@
+import random
+import threading
+import time
+from collections import deque
+
+
+class PygameTransport:
+	"""The real MIDI ports, through pygame.midi (PortMidi)."""
+	def __init__(self) -> None:
+		import pygame.midi
+		self.midi = pygame.midi
+
+	def init(self) -> None:
+		self.midi.init()
+
+	def quit(self) -> None:
+		self.midi.quit()
+
+	def openInput(self, port: int):
+		return self.midi.Input(port)
+
+	def openOutput(self, port: int):
+		return self.midi.Output(port)
+
+	def time(self) -> int:
+		return self.midi.time()
+
+
+class LoopbackTransport:
+	"""In memory MIDI ports, like loopMIDI but without any driver.
+	Everything written to output port X can be read from input port X, with the given latency and jitter.
+	The ports work like pygame.midi.Input/Output so MidiDevice can't tell the difference.
+	Messages stay in order, like on a real cable. A sysex message is read back as one event.
+	Every event is timestamped (ms, like pygame.midi.time()) with the time it arrived on the input, so with latency and jitter.
+	Args:
+	- latency (float)	Seconds between a write and the message being readable
+	- jitter  (float)	Random extra latency, 0 to jitter seconds
+	- seed    (int)		Seed for the jitter, for repeatable runs
+	"""
+	def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = None) -> None:
+		self.latency = latency
+		self.jitter = jitter
+		self._random = random.Random(seed)
+		self._start = time.perf_counter()
+		self._cables = {}
+		self._lock = threading.Lock()
+
+	def init(self) -> None:	pass
+	def quit(self) -> None:	pass
+
+	def openInput(self, port):
+		return LoopbackInput(self, self._cable(port))
+
+	def openOutput(self, port):
+		return LoopbackOutput(self, self._cable(port))
+
+	def time(self) -> int:
+		return int((time.perf_counter() - self._start) * 1000)
+
+	def _cable(self, port) -> '_Cable':
+		with self._lock:
+			if port not in self._cables: self._cables[port] = _Cable()
+			return self._cables[port]
+
+	def _deliverAt(self, cable: '_Cable') -> float:
+		at = time.perf_counter()
+		if self.latency or self.jitter: at += self.latency + self._random.random() * self.jitter
+		cable.last = at = max(at, cable.last)	# no overtaking
+		return at
+
+	def _stamp(self, at: float) -> int:
+		return int((at - self._start) * 1000)
+
+
+class _Cable:
+	def __init__(self) -> None:
+		self.events = deque()									# (deliver at, [[status, data...], timestamp])
+		self.last = 0.0
+
+
+class LoopbackInput:
+	def __init__(self, transport: LoopbackTransport, cable: _Cable) -> None:
+		self.transport = transport
+		self.cable = cable
+
+	def poll(self) -> bool:
+		events = self.cable.events
+		return bool(events) and events[0][0] <= time.perf_counter()
+
+	def read(self, count: int) -> list:
+		events, now, data = self.cable.events, time.perf_counter(), []
+		stamp = self.transport._stamp
+		while events and len(data) < count and events[0][0] <= now:
+			at, message = events.popleft()
+			data.append([message, stamp(at)])
+		return data
+
+	def close(self) -> None: pass
+
+
+class LoopbackOutput:
+	def __init__(self, transport: LoopbackTransport, cable: _Cable) -> None:
+		self.transport = transport
+		self.cable = cable
+
+	def write(self, data: list) -> None:
+		events = self.cable.events
+		for message, _ in data:
+			events.append((self.transport._deliverAt(self.cable), [*message, 0, 0, 0][:4]))
+
+	def write_short(self, status: int, data1: int = 0, data2: int = 0) -> None:
+		self.write([[[status, data1, data2], 0]])
+
+	def write_sys_ex(self, when, message) -> None:
+		self.cable.events.append((self.transport._deliverAt(self.cable), list(message)))
+
+	def close(self) -> None: pass
+
+
+class ReplayTransport:
+	"""Replays recorded MIDI from a file on every input port, the outputs only count what is written.
+	The file has one json list per line: [time in ms, status, data1, data2].
+	Args:
+	- path  (str)	The recording
+	- speed (float)	Replay speed, 2 is twice as fast, 0 replays everything at once
+	"""
+	def __init__(self, path: str, speed: float = 1.0) -> None:
+		import json	# only replays need it, not the startup of the bridge
+		with open(path, 'r') as file:
+			self.events = [json.loads(line) for line in file if line.strip()]
+		self.speed = speed
+		self._start = time.perf_counter()
+
+	def init(self) -> None:	pass
+	def quit(self) -> None:	pass
+
+	def openInput(self, port):
+		return ReplayInput(self)
+
+	def openOutput(self, port):
+		return CountingOutput()
+
+	def time(self) -> int:
+		return int((time.perf_counter() - self._start) * 1000)
+
+
+class ReplayInput:
+	def __init__(self, transport: ReplayTransport) -> None:
+		self.transport = transport
+		self.start = time.perf_counter()
+		self.index = 0
+
+	def _due(self) -> bool:
+		if self.index >= len(self.transport.events): return False
+		if not self.transport.speed: return True
+		first = self.transport.events[0][0]
+		return (self.transport.events[self.index][0] - first) / 1000 / self.transport.speed <= time.perf_counter() - self.start
+
+	def poll(self) -> bool:
+		return self._due()
+
+	def read(self, count: int) -> list:
+		data = []
+		while len(data) < count and self._due():
+			stamp, *message = self.transport.events[self.index]
+			data.append([[*message, 0, 0, 0][:4], stamp])
+			self.index += 1
+		return data
+
+	def close(self) -> None: pass
+
+
+class CountingOutput:
+	def __init__(self) -> None:
+		self.messages = 0
+		self.sysex = 0
+
+	def write(self, data: list) -> None:				self.messages += len(data)
+	def write_short(self, status, data1=0, data2=0) -> None:	self.messages += 1
+	def write_sys_ex(self, when, message) -> None:		self.sysex += 1
+	def close(self) -> None: pass
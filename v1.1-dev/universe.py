@@ -0,0 +1,49 @@
+from array import array
+
+CHANNELS = 512													# channels per dmx universe
+
+
+class DmxUniverse:
+	"""The levels (0-255) of one or more dmx universes, in one flat array('B') of 512 bytes per universe.
+	bank() gives a memoryview of the channels of a bank, so showing a bank is one slice and no copy.
+	Writes to a view change the levels.
+	Args:
+	- universes (int)	Number of universes
+	"""
+	def __init__(self, universes: int = 1) -> None:
+		self.universes = universes
+		self.levels = array('B', bytes(CHANNELS * universes))
+		self._view = memoryview(self.levels)
+
+	def __len__(self) -> int:
+		return len(self.levels)
+
+	def bank(self, bank: int, width: int = 8, universe: int = 0) -> memoryview:
+		"""The levels of width channels from bank (8 channels per bank), cut off at the end of the universe.
+		Args:
+		- bank     (int)	The first bank
+		- width    (int)	Number of channels, 8 per surface
+		- universe (int)	The universe
+		Returns:
+		- (memoryview)	A view of the levels, not a copy
+		"""
+		start = universe * CHANNELS + bank * 8
+		return self._view[start:min(start + width, (universe + 1) * CHANNELS)]
+
+	def get(self, channel: int, universe: int = 0) -> int:
+		return self.levels[universe * CHANNELS + channel]
+
+	def set(self, channel: int, level: int, universe: int = 0) -> None:
+		self.levels[universe * CHANNELS + channel] = max(0, min(level, 255))
+
+	def clear(self) -> None:
+		self._view[:] = bytes(len(self.levels))
+
+
+def toLevel(value: int) -> int:
+	"""7-bit midi value to a 8-bit dmx level, 127 is 255."""
+	return value << 1 | value >> 6
+
+def toMidi(level: int) -> int:
+	"""8-bit dmx level to a 7-bit midi value."""
+	return level >> 1